@@ -0,0 +1,116 @@
+"""Local stand-in for fantasy.formula1.com serving the JSON fixtures."""
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+ROUTES = [
+    ("schedule", re.compile(r"^/feeds/schedule/raceday_en\.json")),
+    ("drivers", re.compile(r"^/feeds/drivers/1_en\.json")),
+    (
+        "leaderboard",
+        re.compile(
+            r"^/services/user/leaderboard/[^/]+/pvtleagueuserrankget/"
+            r"(?:[^/]+/){4}(?P<page>\d+)/(?P<page_size>\d+)/?$"
+        ),
+    ),
+    (
+        "opponent_team",
+        re.compile(r"^/services/user/opponentteam/opponentgamedayplayerteamget/"),
+    ),
+]
+
+
+def load_fixtures() -> Dict[str, dict]:
+    fixtures = {}
+    for name, _ in ROUTES:
+        with open(os.path.join(FIXTURES_DIR, f"{name}.json")) as f:
+            fixtures[name] = json.load(f)
+    return fixtures
+
+
+class FantasyAPIStub:
+    """
+    Serves the fixtures on localhost, adding `latency` seconds to every
+    response, and counts the requests received per route.
+    """
+
+    def __init__(self, latency: float = 0.0, hostname: str = "127.0.0.1"):
+        self.latency = latency
+        self.fixtures = load_fixtures()
+        self.calls: Counter = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((hostname, 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        hostname, port = self.server.server_address[:2]
+        return f"http://{hostname}:{port}"
+
+    def start(self) -> "FantasyAPIStub":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def total_calls(self) -> int:
+        with self.lock:
+            return sum(self.calls.values())
+
+    def route(self, path: str) -> Tuple[Optional[str], Optional[dict]]:
+        for name, pattern in ROUTES:
+            match = pattern.match(path)
+            if match is None:
+                continue
+            body = self.fixtures[name]
+            if name == "leaderboard":
+                page = int(match.group("page"))
+                page_size = int(match.group("page_size"))
+                rows = body["Data"]["Value"]["memRank"]
+                rows = rows[(page - 1) * page_size : page * page_size]  # noqa: E203
+                body = {"Data": {"Value": {**body["Data"]["Value"], "memRank": rows}}}
+            return name, body
+        return None, None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately: without this, Nagle and
+            # delayed ACKs add ~40ms to every keep-alive response.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                name, body = stub.route(self.path)
+                with stub.lock:
+                    stub.calls[name or "unknown"] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if body is None:
+                    self._reply(404, {"Message": "Not found"})
+                else:
+                    self._reply(200, body)
+
+            def _reply(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
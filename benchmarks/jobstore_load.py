@@ -0,0 +1,127 @@
+"""
+Stores lineup reminder jobs pickled and in the compact format, then reports
+how long loading all of them takes, its allocation peak and the latency of a
+lookup by job name.
+
+    poetry run python benchmarks/jobstore_load.py --jobs 100000 --url postgresql://...
+"""
+import argparse
+import datetime
+import logging
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pytz
+from apscheduler.triggers.date import DateTrigger
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from adapters.persistence.jobstore import PTBSQLAlchemyJobStore  # noqa: E402
+from adapters.persistence.lineup_reminder_subscription_store import (  # noqa: E402
+    LineupReminderSubscriptionStore,
+)
+from bot.lineup_reminders import (  # noqa: E402
+    LineupReminderScheduler,
+    send_lineup_reminders,
+)
+from core.lineup_reminder import lineup_reminder_job_name  # noqa: E402
+from telegram.ext import Dispatcher, JobQueue  # noqa: E402
+from telegram_fakes import FakeBot  # noqa: E402
+
+MINUTES_PER_RACE = 1000
+
+
+def fill(
+    store: PTBSQLAlchemyJobStore, job_queue: JobQueue, url: str, jobs: int
+) -> None:
+    reminders = LineupReminderScheduler(
+        job_queue=job_queue,
+        jobstore=store,
+        subscription_store=LineupReminderSubscriptionStore(url=url),
+        logger=logging.getLogger("benchmark"),
+    )
+    start = datetime.datetime.now(pytz.utc) + datetime.timedelta(days=1)
+    batch = []
+    for i in range(jobs):
+        race_id, minute = 1 + i // MINUTES_PER_RACE, 1 + i % MINUTES_PER_RACE
+        run_date = start + datetime.timedelta(days=race_id, minutes=-minute)
+        batch.append(
+            reminders._build_job(  # pylint: disable=W0212
+                name=lineup_reminder_job_name(race_id, minute),
+                trigger=DateTrigger(run_date=run_date, timezone=pytz.utc),
+                next_run_time=run_date,
+            )
+        )
+        if len(batch) == 5000:
+            store.replace_jobs(remove_ids=[], jobs=batch)
+            batch = []
+    store.replace_jobs(remove_ids=[], jobs=batch)
+
+
+def measure(store: PTBSQLAlchemyJobStore, names: int) -> dict:
+    started = time.perf_counter()
+    jobs = store.get_all_jobs()
+    load_seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    store.get_all_jobs()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    lookups = []
+    for job in jobs[:: max(1, len(jobs) // names)][:names]:
+        started = time.perf_counter()
+        store.get_jobs_by_name(job.name)
+        lookups.append(time.perf_counter() - started)
+    return {
+        "jobs": len(jobs),
+        "load_s": load_seconds,
+        "peak_mib": peak / 2**20,
+        "lookup_ms": statistics.median(lookups) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--url", help="database url, a temporary SQLite by default")
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    url = args.url or f"sqlite:///{os.path.join(directory.name, 'jobs.db')}"
+    job_queue = JobQueue()
+    dispatcher = Dispatcher(FakeBot(), queue.Queue(), job_queue=job_queue)
+    job_queue.set_dispatcher(dispatcher)
+
+    print(f"{'format':<8} {'jobs':>8} {'load s':>8} {'peak MiB':>9} {'lookup ms':>10}")
+    for label, callback in (("pickle", None), ("compact", send_lineup_reminders)):
+        store = PTBSQLAlchemyJobStore(
+            dispatcher=dispatcher,
+            lineup_reminder_callback=callback,
+            url=url,
+            tablename=f"benchmark_jobs_{label}",
+        )
+        store.start(job_queue.scheduler, label)
+        try:
+            fill(store, job_queue, url, args.jobs)
+            result = measure(store, args.lookups)
+            print(
+                f"{label:<8} {result['jobs']:>8} {result['load_s']:>8.2f} "
+                f"{result['peak_mib']:>9.1f} {result['lookup_ms']:>10.3f}"
+            )
+        finally:
+            store.jobs_t.drop(store.engine)
+            store.shutdown()
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Runs every handler from bot.handlers.get_handlers end-to-end against the local
+fantasy API stub and reports latency percentiles, upstream calls and
+allocations per command.
+
+    poetry run python benchmarks/run_handlers.py --iterations 200 --latency-ms 50
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import prettytable as pt
+import pytz
+from apscheduler.schedulers.background import BackgroundScheduler
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from adapters.render_cache import RenderCache  # noqa: E402
+from bot.handler_executor import HandlerExecutor  # noqa: E402
+from bot.handlers import get_handlers  # noqa: E402
+from event_loop import EventLoopThread  # noqa: E402
+from fantasy_api_stub import FantasyAPIStub  # noqa: E402
+from http_client import AsyncHTTPClient  # noqa: E402
+from services.async_f1_fantasy_service import AsyncF1FantasyService  # noqa: E402
+from services.drivers_catalog import DriversCatalog  # noqa: E402
+from services.f1_fantasy_service import F1FantasyService  # noqa: E402
+from services.race_calendar_service import RaceCalendarService  # noqa: E402
+from services.standings_history_service import (  # noqa: E402
+    StandingsHistoryService,
+)
+from telegram.ext import CallbackQueryHandler, CommandHandler  # noqa: E402
+from telegram_fakes import (  # noqa: E402
+    FakeBot,
+    FakeLineupReminderScheduler,
+    fake_context,
+    fake_update,
+)
+
+Scenario = Callable[[], None]
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Application:
+    def __init__(self, base_url: str):
+        logger = logging.getLogger("benchmark")
+        self.event_loop = EventLoopThread()
+        self.event_loop.start()
+        self.async_service = AsyncF1FantasyService(
+            http_client=AsyncHTTPClient(base_url=base_url),
+            logger=logger,
+            cookies="benchmark",
+            league_id="1",
+        )
+        self.service = F1FantasyService(
+            async_service=self.async_service, event_loop=self.event_loop
+        )
+        # Never started: scheduled refreshes are only recorded.
+        scheduler = BackgroundScheduler(timezone=pytz.utc)
+        self.race_calendar_service = RaceCalendarService(
+            f1_fantasy_service=self.service, scheduler=scheduler, logger=logger
+        )
+        self.race_calendar_service.refresh()
+        self.drivers_catalog = DriversCatalog(
+            f1_fantasy_service=self.service, logger=logger
+        )
+        self.drivers_catalog.refresh()
+        self.standings_history_service = StandingsHistoryService(
+            f1_fantasy_service=self.service, logger=logger
+        )
+        self.standings_history_service.refresh(self.race_calendar_service.calendar)
+        self.render_cache = RenderCache()
+        self.handlers = get_handlers(
+            drivers_catalog=self.drivers_catalog,
+            f1_fantasy_service=self.service,
+            race_calendar_service=self.race_calendar_service,
+            render_cache=self.render_cache,
+            standings_history_service=self.standings_history_service,
+            lineup_reminder_scheduler=FakeLineupReminderScheduler(),
+            # No workers: handlers run inline, to be timed end-to-end.
+            handler_executor=HandlerExecutor(workers=0, queue_size=0, logger=logger),
+        )
+
+    def clear_caches(self) -> None:
+        self.async_service.season_races_cache.invalidate()
+        self.async_service.leaderboard_cache.clear()
+        self.render_cache.cache.clear()
+
+    def scenarios(self, button_data: str) -> Dict[str, Scenario]:
+        scenarios: Dict[str, Scenario] = {}
+        for handler in self.handlers:
+            if isinstance(handler, CommandHandler):
+                name = f"/{sorted(handler.command)[0]}"
+                scenarios[name] = self._command(handler.callback)
+            elif isinstance(handler, CallbackQueryHandler):
+                scenarios["button"] = self._button(handler.callback, button_data)
+        return scenarios
+
+    @staticmethod
+    def _command(callback) -> Scenario:
+        def run() -> None:
+            bot = FakeBot()
+            callback(fake_update(bot), fake_context(bot))
+
+        return run
+
+    @staticmethod
+    def _button(callback, data: str) -> Scenario:
+        def run() -> None:
+            bot = FakeBot()
+            callback(fake_update(bot, callback_data=data), fake_context(bot))
+
+        return run
+
+
+def measure(
+    app: Application,
+    stub: FantasyAPIStub,
+    scenario: Scenario,
+    iterations: int,
+    cold: bool,
+) -> Tuple[List[float], float, float]:
+    latencies = []
+    upstream_calls = 0
+    for _ in range(iterations):
+        if cold:
+            app.clear_caches()
+        calls_before = stub.total_calls()
+        started_at = time.perf_counter()
+        scenario()
+        latencies.append(time.perf_counter() - started_at)
+        upstream_calls += stub.total_calls() - calls_before
+
+    # Allocations are measured in a separate pass: tracing slows everything down.
+    peaks = []
+    tracemalloc.start()
+    for _ in range(max(1, iterations // 10)):
+        if cold:
+            app.clear_caches()
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        scenario()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return latencies, upstream_calls / iterations, sorted(peaks)[len(peaks) // 2]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--cold", action="store_true", help="clear the caches before each call"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    stub = FantasyAPIStub(latency=args.latency_ms / 1000).start()
+    app = Application(base_url=stub.base_url)
+    button_data = stub.fixtures["leaderboard"]["Data"]["Value"]["memRank"][0]["guid"]
+
+    results = {}
+    for name, scenario in app.scenarios(button_data).items():
+        scenario()  # warm up connections and lazy imports
+        latencies, upstream_calls, peak = measure(
+            app, stub, scenario, iterations=args.iterations, cold=args.cold
+        )
+        results[name] = {
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "upstream_calls": upstream_calls,
+            "peak_alloc_kib": peak / 1024,
+        }
+
+    table = pt.PrettyTable(
+        ["Command", "p50 ms", "p95 ms", "p99 ms", "Upstream/op", "Peak KiB/op"]
+    )
+    table.align = "r"
+    table.align["Command"] = "l"
+    for name, r in results.items():
+        table.add_row(
+            [
+                name,
+                f"{r['p50_ms']:.2f}",
+                f"{r['p95_ms']:.2f}",
+                f"{r['p99_ms']:.2f}",
+                f"{r['upstream_calls']:.2f}",
+                f"{r['peak_alloc_kib']:.1f}",
+            ]
+        )
+    print(table)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "date": datetime.datetime.now().isoformat(),
+                    "iterations": args.iterations,
+                    "latency_ms": args.latency_ms,
+                    "cold": args.cold,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    app.event_loop.run(app.async_service.http_client.close())
+    app.event_loop.stop()
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
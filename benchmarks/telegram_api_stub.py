@@ -0,0 +1,182 @@
+"""Local stand-in for the Telegram Bot API delivering pushed updates."""
+import http.client
+import json
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+METHOD_PATTERN = re.compile(r"^/bot[^/]+/(?P<method>\w+)$")
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "bot"}
+
+
+def message_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+
+
+class TelegramAPIStub:
+    """
+    Hands the pushed updates out through getUpdates long polling or, once
+    setWebhook is called, POSTs them one per request to the webhook over
+    max_connections keep-alive connections, as Telegram does. `latency` seconds
+    are added to every request and response crossing the network, both ways.
+    """
+
+    def __init__(self, latency: float = 0.0, hostname: str = "127.0.0.1"):
+        self.latency = latency
+        self.webhook_connections = 0
+        self.pushed_at: Dict[int, float] = {}
+        self.pending: List[dict] = []
+        self.condition = threading.Condition()
+        self.closing = False
+        self.webhook_url: Optional[str] = None
+        self.secret_token: Optional[str] = None
+        self.deliveries: queue.Queue = queue.Queue()
+        self.server = ThreadingHTTPServer((hostname, 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        hostname, port = self.server.server_address[:2]
+        return f"http://{hostname}:{port}/bot"
+
+    def start(self) -> "TelegramAPIStub":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        for _ in range(self.webhook_connections):
+            self.deliveries.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push(self, updates: List[dict]) -> None:
+        now = time.monotonic()
+        for update in updates:
+            self.pushed_at[update["update_id"]] = now
+        if self.webhook_url:
+            for update in updates:
+                self.deliveries.put(update)
+            return
+        with self.condition:
+            self.pending.extend(updates)
+            self.condition.notify_all()
+
+    def get_updates(self, offset: int, limit: int, timeout: float) -> List[dict]:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            while not self.pending and not self.closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.pending[:limit]
+
+    def set_webhook(
+        self, url: str, secret_token: Optional[str], max_connections: int
+    ) -> None:
+        self.webhook_url, self.secret_token = url, secret_token
+        self.webhook_connections = max_connections
+        for _ in range(max_connections):
+            threading.Thread(target=self._deliver, daemon=True).start()
+
+    def _deliver(self) -> None:
+        url = urlsplit(self.webhook_url)
+        connection = http.client.HTTPConnection(url.hostname, url.port)
+        headers = {"Content-Type": "application/json"}
+        if self.secret_token:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.secret_token
+        while True:
+            update = self.deliveries.get()
+            if update is None:
+                connection.close()
+                return
+            time.sleep(self.latency)
+            connection.request("POST", url.path, json.dumps(update), headers)
+            connection.getresponse().read()
+            time.sleep(self.latency)
+
+    def call(self, method: str, params: dict):
+        if method == "getUpdates":
+            return self.get_updates(
+                offset=int(params.get("offset") or 0),
+                limit=int(params.get("limit") or 100),
+                timeout=float(params.get("timeout") or 0),
+            )
+        if method == "setWebhook":
+            self.set_webhook(
+                params["url"],
+                params.get("secret_token"),
+                int(params.get("max_connections") or 40),
+            )
+            return True
+        if method == "deleteWebhook":
+            return True
+        if method == "getMe":
+            return BOT_USER
+        return None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                time.sleep(stub.latency)
+                match = METHOD_PATTERN.match(self.path)
+                params = json.loads(body) if body else {}
+                result = stub.call(match.group("method"), params) if match else None
+                time.sleep(stub.latency)
+                if result is None:
+                    self._reply(404, {"ok": False, "description": "Not Found"})
+                else:
+                    self._reply(200, {"ok": True, "result": result})
+
+            def _reply(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def serve(latency: float, commands, replies) -> None:
+    """
+    Runs the stub in a process of its own, Telegram's side not to compete for
+    the GIL with the bot: replies with the base URL, then pushes the batches of
+    updates received until None, and replies with when each update was pushed.
+    """
+    stub = TelegramAPIStub(latency=latency).start()
+    replies.put(stub.base_url)
+    for updates in iter(commands.get, None):
+        stub.push(updates)
+    replies.put(stub.pushed_at)
+    stub.stop()
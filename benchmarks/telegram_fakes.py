@@ -0,0 +1,71 @@
+"""Minimal stand-ins for the telegram objects the handlers touch."""
+from types import SimpleNamespace
+from typing import List, Optional
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.sent: List[str] = []
+        self.defaults = None
+
+    def send_message(self, chat_id, text: str, **kwargs) -> None:
+        self.sent.append(text)
+
+
+class FakeJobQueue:
+    def __init__(self) -> None:
+        self.jobs: List[dict] = []
+
+    def run_once(self, callback, when, context=None, name=None, **kwargs) -> None:
+        self.jobs.append({"callback": callback, "when": when, "name": name})
+
+    def get_jobs_by_name(self, name: str) -> list:
+        return []
+
+
+class FakeLineupReminderScheduler:
+    def __init__(self) -> None:
+        self.reminders: dict = {}
+
+    def subscribe(self, user_id, chat_id, races, minutes) -> bool:
+        removed = user_id in self.reminders
+        self.reminders[user_id] = list(minutes)
+        return removed
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int) -> None:
+        self.bot = bot
+        self.chat_id = chat_id
+
+    def reply_text(self, text: str, **kwargs) -> None:
+        self.bot.sent.append(text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot: FakeBot, data: str) -> None:
+        self.bot = bot
+        self.data = data
+
+    def answer(self) -> None:
+        pass
+
+    def edit_message_text(self, text: str, **kwargs) -> None:
+        self.bot.sent.append(text)
+
+
+def fake_update(
+    bot: FakeBot, chat_id: int = 1, callback_data: Optional[str] = None
+) -> SimpleNamespace:
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id),
+        effective_user=SimpleNamespace(id=chat_id),
+        message=FakeMessage(bot, chat_id),
+        callback_query=(
+            FakeCallbackQuery(bot, callback_data) if callback_data else None
+        ),
+    )
+
+
+def fake_context(bot: FakeBot, args: Optional[List[str]] = None) -> SimpleNamespace:
+    return SimpleNamespace(bot=bot, args=args or [], job_queue=FakeJobQueue())
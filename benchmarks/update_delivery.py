@@ -0,0 +1,181 @@
+"""
+Pushes bursts of updates through a local Telegram Bot API stand-in and reports
+the time from an update being sent to its handler running, when polling and
+through the webhook served by the HTTP server.
+
+    poetry run python benchmarks/update_delivery.py --burst-size 20 --latency-ms 30
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import prettytable as pt
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import http_server  # noqa: E402
+from bot.telegram_bot import webhook_handler  # noqa: E402
+from run_handlers import percentile  # noqa: E402
+from telegram import Bot, Update  # noqa: E402
+from telegram.ext import CallbackContext, Dispatcher, TypeHandler, Updater  # noqa: E402
+from telegram_api_stub import message_update, serve  # noqa: E402
+
+TOKEN = "123456:benchmark"
+SECRET_TOKEN = "benchmark-secret"
+
+
+class Receiver:
+    """Records when the handler runs for every update."""
+
+    def __init__(self) -> None:
+        self.handled_at: Dict[int, float] = {}
+        self.condition = threading.Condition()
+
+    def handler(self) -> TypeHandler:
+        def record(update: Update, context: CallbackContext) -> None:
+            with self.condition:
+                self.handled_at[update.update_id] = time.monotonic()
+                self.condition.notify_all()
+
+        return TypeHandler(Update, record)
+
+    def wait(self, count: int, timeout: float) -> bool:
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: len(self.handled_at) >= count, timeout=timeout
+            )
+
+
+class RemoteStub:
+    """The Telegram API stand-in, running in another process."""
+
+    def __init__(self, latency: float):
+        context = multiprocessing.get_context("spawn")
+        self.commands, self.replies = context.Queue(), context.Queue()
+        self.process = context.Process(
+            target=serve, args=(latency, self.commands, self.replies), daemon=True
+        )
+        self.process.start()
+        self.base_url = self.replies.get()
+
+    def push(self, updates: List[dict]) -> None:
+        self.commands.put(updates)
+
+    def stop(self) -> Dict[int, float]:
+        """Stops the stub, returning when each update was pushed."""
+        self.commands.put(None)
+        pushed_at = self.replies.get()
+        self.process.join()
+        return pushed_at
+
+
+def run_bursts(
+    stub: RemoteStub, receiver: Receiver, bursts: int, burst_size: int
+) -> None:
+    update_id = 1
+    for _ in range(bursts):
+        updates = [
+            message_update(update_id + i, chat_id=1000 + i, text="/help")
+            for i in range(burst_size)
+        ]
+        update_id += burst_size
+        stub.push(updates)
+        if not receiver.wait(update_id - 1, timeout=60):
+            raise RuntimeError("Updates were not delivered")
+        time.sleep(0.2)
+
+
+def latencies(receiver: Receiver, pushed_at: Dict[int, float]) -> List[float]:
+    return [
+        receiver.handled_at[update_id] - pushed
+        for update_id, pushed in pushed_at.items()
+    ]
+
+
+def measure_polling(latency: float, bursts: int, burst_size: int) -> List[float]:
+    stub = RemoteStub(latency=latency)
+    receiver = Receiver()
+    updater = Updater(bot=Bot(TOKEN, base_url=stub.base_url))
+    updater.dispatcher.add_handler(receiver.handler())
+    updater.start_polling(poll_interval=0.0, timeout=10)
+    try:
+        run_bursts(stub, receiver, bursts, burst_size)
+    finally:
+        pushed_at = stub.stop()
+        updater.stop()
+    return latencies(receiver, pushed_at)
+
+
+def measure_webhook(
+    latency: float, bursts: int, burst_size: int, max_connections: int
+) -> List[float]:
+    stub = RemoteStub(latency=latency)
+    receiver = Receiver()
+    bot = Bot(TOKEN, base_url=stub.base_url)
+    dispatcher = Dispatcher(bot, queue.Queue())
+    dispatcher.add_handler(receiver.handler())
+    server = http_server.start(
+        log=logging.getLogger("benchmark"), hostname="127.0.0.1", port=0
+    )
+    server.webhook = http_server.Webhook(
+        path="/telegram",
+        secret_token=SECRET_TOKEN,
+        handle=webhook_handler(dispatcher),
+    )
+    threading.Thread(target=dispatcher.start, daemon=True).start()
+    bot.set_webhook(
+        url=f"http://127.0.0.1:{server.server_port}/telegram",
+        secret_token=SECRET_TOKEN,
+        max_connections=max_connections,
+    )
+    try:
+        run_bursts(stub, receiver, bursts, burst_size)
+    finally:
+        pushed_at = stub.stop()
+        dispatcher.stop()
+        server.shutdown()
+    return latencies(receiver, pushed_at)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--burst-size", type=int, default=20)
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument(
+        "--latency-ms", type=float, default=30.0, help="one-way network latency"
+    )
+    args = parser.parse_args()
+    # Every request would be logged to stderr.
+    http_server.PythonServer.log_message = lambda *args: None  # type: ignore
+
+    table = pt.PrettyTable(["Mode", "p50 ms", "p95 ms", "p99 ms", "max ms"])
+    table.align = "r"
+    table.align["Mode"] = "l"
+    modes = {
+        "polling": lambda: measure_polling(latency, args.bursts, args.burst_size),
+        "webhook": lambda: measure_webhook(
+            latency, args.bursts, args.burst_size, args.max_connections
+        ),
+    }
+    latency = args.latency_ms / 1000
+    for mode, measure in modes.items():
+        samples = measure()
+        table.add_row(
+            [mode]
+            + [f"{percentile(samples, p) * 1000:.1f}" for p in (50, 95, 99)]
+            + [f"{max(samples) * 1000:.1f}"]
+        )
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
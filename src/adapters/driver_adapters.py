@@ -0,0 +1,20 @@
+from typing import Dict
+
+from core.driver import Driver
+
+
+def to_driver(json: dict) -> Driver:
+    return Driver(
+        player_id=int(json["PlayerId"]),
+        display_name=json["DisplayName"],
+        team_name=json["TeamName"],
+        gameday_points=json["GamedayPoints"],
+    )
+
+
+def to_drivers(json: dict) -> Dict[int, Driver]:
+    drivers = {}
+    for d in json["Data"]["Value"]:
+        driver = to_driver(d)
+        drivers[driver.player_id] = driver
+    return drivers
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Hashable, List, Optional
 
 import prettytable as pt
 from adapters.user_adapters import to_user
@@ -39,6 +39,33 @@ def league_standing_to_pretty_table(standing: LeagueStanding) -> pt.PrettyTable:
     return table
 
 
+def league_standing_to_html(
+    standing: LeagueStanding, title: Optional[str] = None
+) -> str:
+    table = league_standing_to_pretty_table(standing)
+    if title:
+        table.title = title
+    return f"<pre>{table}</pre>"
+
+
+def standing_age_to_html(standing: LeagueStanding) -> str:
+    """Note of how old a standing served while upstream is unavailable is."""
+    if standing.age is None:
+        return ""
+    minutes = max(1, round(standing.age / 60))
+    return f"\n<i>As of {minutes} min ago, F1 Fantasy is not responding</i>"
+
+
+def league_standing_fingerprint(
+    standing: LeagueStanding, title: Optional[str] = None
+) -> Hashable:
+    return (
+        "league_standing",
+        title,
+        tuple((e.user.username, e.score) for e in standing.entrants),
+    )
+
+
 def entrant_to_pretty_input(
     standing: LeagueStanding,
 ) -> List[List[InlineKeyboardButton]]:
@@ -29,27 +29,70 @@
 """This file contains PTBSQLAlchemyJobStore."""
 
 import logging
-from typing import Any
+import pickle
+from typing import Any, Callable, List, Optional
 
 import telegram
 from apscheduler.job import Job as APSJob
+from apscheduler.jobstores.base import ConflictingIdError, JobLookupError
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.util import (
+    datetime_to_utc_timestamp,
+    obj_to_ref,
+    utc_timestamp_to_datetime,
+)
+from pytz import utc
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    func,
+    Index,
+    inspect,
+    Integer,
+    select,
+    Table,
+    text,
+    Unicode,
+)
+from sqlalchemy.exc import IntegrityError
 from telegram.ext import CallbackContext, Dispatcher
 
+from core.lineup_reminder import parse_lineup_reminder_job_name
+
 logger = logging.getLogger(name=__name__)
 logger.setLevel(level="DEBUG")
 
+# Pickles never start with a NUL byte. The schema version follows the prefix:
+# version 1 rows were per-user reminders, migrated to subscriptions.
+LINEUP_REMINDER_STATE_PREFIX = b"\x00lineup-reminder:"
+LINEUP_REMINDER_SCHEMA_VERSION = 2
+
 
 class PTBSQLAlchemyJobStore(SQLAlchemyJobStore):
     """
     Wraps apscheduler.SQLAlchemyJobStore to make :class:`telegram.ext.Job` class storable.
+
+    Besides APScheduler's columns, every job row has its name, indexed, the
+    race of lineup reminders, and the chat and user of the per-user reminders
+    scheduled before subscriptions. Lineup reminders are not pickled: they are
+    rebuilt from those columns, job_state only holding a schema version.
     """
 
-    def __init__(self, dispatcher: Dispatcher, **kwargs: Any) -> None:
+    jobs_t: Table
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        lineup_reminder_callback: Optional[Callable[[CallbackContext], None]] = None,
+        **kwargs: Any,
+    ) -> None:
         """
         Args:
             dispatcher (:class:`telegram.ext.Dispatcher`): Dispatcher instance
                 that will be passed to CallbackContext when recreating jobs.
+            lineup_reminder_callback (:obj:`callable`, optional): Callback of the
+                lineup reminder jobs, which are then stored without pickling.
             **kwargs (:obj:`dict`): Arbitrary keyword Arguments to be passed to
                 the SQLAlchemyJobStore constructor.
         """
@@ -64,6 +107,30 @@ class PTBSQLAlchemyJobStore(SQLAlchemyJobStore):
 
         super().__init__(**kwargs)
         self.dispatcher = dispatcher
+        self.lineup_reminder_callback = lineup_reminder_callback
+        self.lineup_reminder_ref = (
+            obj_to_ref(lineup_reminder_callback) if lineup_reminder_callback else None
+        )
+        tablename = self.jobs_t.name
+        self.jobs_t = Table(
+            tablename,
+            self.jobs_t.metadata,
+            Column("name", Unicode(191), index=True),
+            Column("chat_id", BigInteger),
+            Column("user_id", BigInteger),
+            Column("race_id", Integer),
+            Index(f"ix_{tablename}_user_id_race_id", "user_id", "race_id"),
+            schema=self.jobs_t.schema,
+            extend_existing=True,
+        )
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        self._migrate()
+
+    def lookup_job(self, job_id: str) -> Optional[APSJob]:
+        jobs = self._get_jobs(self.jobs_t.c.id == job_id)
+        return jobs[0] if jobs else None
 
     def add_job(self, job: APSJob) -> None:
         """
@@ -71,8 +138,8 @@ class PTBSQLAlchemyJobStore(SQLAlchemyJobStore):
         Args:
             job (:obj:`apscheduler.job`): The job to be persisted.
         """
-        job = self._prepare_job(job)
-        super().add_job(job)
+        # The whole row is written, not only APScheduler's columns.
+        self.replace_jobs(remove_ids=[], jobs=[job])
 
     def update_job(self, job: APSJob) -> None:
         """
@@ -80,8 +147,120 @@ class PTBSQLAlchemyJobStore(SQLAlchemyJobStore):
         Args:
             job (:obj:`apscheduler.job`): The job to be updated.
         """
-        job = self._prepare_job(job)
-        super().update_job(job)
+        row = self._to_row(job)
+        del row["id"]
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                self.jobs_t.update().where(self.jobs_t.c.id == job.id).values(**row)
+            )
+        if result.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def replace_jobs(self, remove_ids: List[str], jobs: List[APSJob]) -> None:
+        """
+        Deletes and inserts jobs in a single transaction, bypassing the
+        scheduler: the caller has to wake it up once done.
+        Args:
+            remove_ids (:obj:`list`): Ids of the jobs to delete.
+            jobs (:obj:`list`): New jobs, with their next_run_time set.
+        """
+        rows = [self._to_row(job) for job in jobs]
+        try:
+            with self.engine.begin() as connection:
+                if remove_ids:
+                    connection.execute(
+                        self.jobs_t.delete().where(self.jobs_t.c.id.in_(remove_ids))
+                    )
+                if rows:
+                    connection.execute(self.jobs_t.insert(), rows)
+        except IntegrityError:
+            raise ConflictingIdError([job.id for job in jobs])
+
+    def get_jobs_by_name(self, name: str) -> List[APSJob]:
+        """
+        Jobs with the given name, looked up through the name index.
+        Args:
+            name (:obj:`str`): The job name.
+        """
+        return self._get_jobs(self.jobs_t.c.name == name)
+
+    def get_user_lineup_reminder_rows(self) -> list:
+        """
+        The rows of the per-user lineup reminders, read from the columns only,
+        so that they can be migrated without being restored.
+        """
+        selectable = select(
+            self.jobs_t.c.id,
+            self.jobs_t.c.next_run_time,
+            self.jobs_t.c.name,
+            self.jobs_t.c.chat_id,
+            self.jobs_t.c.user_id,
+            self.jobs_t.c.race_id,
+        ).where(self.jobs_t.c.user_id.isnot(None))
+        with self.engine.begin() as connection:
+            return connection.execute(selectable).all()
+
+    def count_jobs(self) -> int:
+        """
+        Counts the stored jobs without loading them.
+        """
+        with self.engine.begin() as connection:
+            return connection.execute(
+                select(func.count()).select_from(self.jobs_t)
+            ).scalar_one()
+
+    def _to_row(self, job: APSJob) -> dict:
+        """
+        Builds the table row of a job, pickling it unless it is a lineup reminder.
+        Args:
+            job (:obj:`apscheduler.job`): The job to be stored.
+        """
+        reminder = parse_lineup_reminder_job_name(job.name)
+        chat_id = None
+        if isinstance(job.args[0], CallbackContext) and job.args[0].job is not None:
+            context = job.args[0].job.context
+            if isinstance(context, str) and context.lstrip("-").isdigit():
+                chat_id = int(context)
+        if self._is_compact_lineup_reminder(job):
+            job_state = LINEUP_REMINDER_STATE_PREFIX + bytes(
+                [LINEUP_REMINDER_SCHEMA_VERSION]
+            )
+        else:
+            job_state = pickle.dumps(
+                self._prepare_job(job).__getstate__(), self.pickle_protocol
+            )
+        return {
+            "id": job.id,
+            "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+            "job_state": job_state,
+            "name": job.name,
+            "chat_id": chat_id,
+            "user_id": reminder.user_id if reminder else None,
+            "race_id": reminder.race_id if reminder else None,
+        }
+
+    def _is_compact_lineup_reminder(self, job: APSJob) -> bool:
+        # Anything that could not be rebuilt from the columns is pickled.
+        defaults = self._scheduler._job_defaults  # pylint: disable=W0212
+        reminder = parse_lineup_reminder_job_name(job.name)
+        return (
+            self.lineup_reminder_callback is not None
+            and job.func is self.lineup_reminder_callback
+            and reminder is not None
+            and reminder.user_id is None
+            and len(job.args) == 1
+            and isinstance(job.args[0], CallbackContext)
+            and job.args[0].job is not None
+            and job.args[0].job.context is None
+            and not job.kwargs
+            and job.executor == "default"
+            and isinstance(job.trigger, DateTrigger)
+            and job.next_run_time is not None
+            and job.next_run_time == job.trigger.run_date
+            and job.misfire_grace_time == defaults["misfire_grace_time"]
+            and job.coalesce == defaults["coalesce"]
+            and job.max_instances == defaults["max_instances"]
+        )
 
     @staticmethod
     def _prepare_job(job: APSJob) -> APSJob:
@@ -100,7 +279,7 @@ class PTBSQLAlchemyJobStore(SQLAlchemyJobStore):
         # it includes refrences to dispatcher which
         # is unpickleable. we'll recreate CallbackContext
         # in _reconstitute_job method.
-        if isinstance(job.args[0], CallbackContext):
+        if isinstance(job.args[0], CallbackContext) and job.args[0].job is not None:
             tg_job = job.args[0].job
             # APScheduler stores args as tuple.
             prepped_job.args = (tg_job.name, tg_job.context)
@@ -116,11 +295,137 @@ class PTBSQLAlchemyJobStore(SQLAlchemyJobStore):
 
         # Here we rebuild callback context for the job which
         # are going for execution.
+        # APScheduler calls the callback of the telegram job itself.
         tg_job = telegram.ext.Job(
-            callback=None,
+            callback=job.func,
             name=job.args[0],
             context=job.args[1],
         )
-        ctx = CallbackContext.from_job(tg_job, self.dispatcher)
+        ctx: CallbackContext = CallbackContext.from_job(tg_job, self.dispatcher)
         job._modify(args=(ctx,))  # pylint: disable=W0212
         return job
+
+    def _reconstitute_lineup_reminder(self, row) -> APSJob:
+        """
+        Rebuilds a lineup reminder from the columns of its row.
+        Args:
+            row: The job row.
+        """
+        version = row.job_state[-1]
+        if version != LINEUP_REMINDER_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported lineup reminder schema version {version}")
+        if self.lineup_reminder_callback is None:
+            raise ValueError("No callback set for lineup reminders")
+        run_date = utc_timestamp_to_datetime(row.next_run_time)
+        tg_job = telegram.ext.Job(callback=self.lineup_reminder_callback, name=row.name)
+        defaults = self._scheduler._job_defaults  # pylint: disable=W0212
+        job = APSJob.__new__(APSJob)
+        job.__setstate__(
+            {
+                "version": 1,
+                "id": row.id,
+                "func": self.lineup_reminder_ref,
+                "trigger": DateTrigger(run_date=run_date, timezone=utc),
+                "executor": "default",
+                "args": (CallbackContext.from_job(tg_job, self.dispatcher),),
+                "kwargs": {},
+                "name": row.name,
+                "misfire_grace_time": defaults["misfire_grace_time"],
+                "coalesce": defaults["coalesce"],
+                "max_instances": defaults["max_instances"],
+                "next_run_time": run_date,
+            }
+        )
+        job._scheduler = self._scheduler  # pylint: disable=W0212
+        job._jobstore_alias = self._alias  # pylint: disable=W0212
+        return job
+
+    def _get_jobs(self, *conditions) -> List[APSJob]:
+        jobs = []
+        selectable = select(
+            self.jobs_t.c.id,
+            self.jobs_t.c.next_run_time,
+            self.jobs_t.c.job_state,
+            self.jobs_t.c.name,
+        ).order_by(self.jobs_t.c.next_run_time)
+        selectable = selectable.where(*conditions) if conditions else selectable
+        with self.engine.begin() as connection:
+            rows = connection.execute(selectable).all()
+        failed_job_ids = set()
+        for row in rows:
+            try:
+                if row.job_state.startswith(LINEUP_REMINDER_STATE_PREFIX):
+                    jobs.append(self._reconstitute_lineup_reminder(row))
+                else:
+                    jobs.append(self._reconstitute_job(row.job_state))
+            except BaseException:
+                self._logger.exception(
+                    'Unable to restore job "%s" -- removing it', row.id
+                )
+                failed_job_ids.add(row.id)
+
+        # Remove all the jobs we failed to restore
+        if failed_job_ids:
+            delete = self.jobs_t.delete().where(self.jobs_t.c.id.in_(failed_job_ids))
+            with self.engine.begin() as connection:
+                connection.execute(delete)
+
+        return jobs
+
+    def _migrate(self) -> None:
+        """
+        Adds the columns and indexes missing from tables created before them,
+        then fills them in for the jobs already stored.
+        """
+        inspector = inspect(self.engine)
+        existing_columns = {
+            column["name"]
+            for column in inspector.get_columns(
+                self.jobs_t.name, schema=self.jobs_t.schema
+            )
+        }
+        preparer = self.engine.dialect.identifier_preparer
+        with self.engine.begin() as connection:
+            for column in self.jobs_t.columns:
+                if column.name not in existing_columns:
+                    logger.info(f"Adding column {column.name} to {self.jobs_t.name}")
+                    connection.execute(
+                        text(
+                            f"ALTER TABLE {preparer.format_table(self.jobs_t)} "
+                            f"ADD COLUMN {preparer.format_column(column)} "
+                            f"{column.type.compile(dialect=self.engine.dialect)}"
+                        )
+                    )
+        for index in self.jobs_t.indexes:
+            index.create(self.engine, checkfirst=True)
+
+        with self.engine.begin() as connection:
+            unnamed = connection.execute(
+                select(self.jobs_t.c.id, self.jobs_t.c.job_state).where(
+                    self.jobs_t.c.name.is_(None)
+                )
+            ).all()
+            for row in unnamed:
+                try:
+                    state = pickle.loads(row.job_state)
+                except Exception:
+                    continue
+                name = state.get("name")
+                reminder = parse_lineup_reminder_job_name(name)
+                args: tuple = state.get("args") or ()
+                context = args[1] if len(args) == 2 else None
+                chat_id = (
+                    int(context)
+                    if isinstance(context, str) and context.lstrip("-").isdigit()
+                    else None
+                )
+                connection.execute(
+                    self.jobs_t.update()
+                    .where(self.jobs_t.c.id == row.id)
+                    .values(
+                        name=name,
+                        chat_id=chat_id,
+                        user_id=reminder.user_id if reminder else None,
+                        race_id=reminder.race_id if reminder else None,
+                    )
+                )
@@ -0,0 +1,96 @@
+from typing import Dict, Iterable, List
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    create_engine,
+    Index,
+    Integer,
+    MetaData,
+    select,
+    Table,
+)
+
+
+class LineupReminderSubscriptionStore:
+    """
+    Chats that asked to be reminded of the lineup deadline, one row per user and
+    minutes before the deadline. Subscriptions hold for every upcoming race:
+    the reminder jobs are per race and minute, and read the chats to notify
+    from here through the (minute, chat_id) index when they fire.
+    """
+
+    def __init__(self, url: str, tablename: str = "lineup_reminder_subscriptions"):
+        self.engine = create_engine(url)
+        self.subscriptions_t = Table(
+            tablename,
+            MetaData(),
+            Column("user_id", BigInteger, primary_key=True, autoincrement=False),
+            Column("minute", Integer, primary_key=True, autoincrement=False),
+            Column("chat_id", BigInteger, nullable=False),
+            Index(f"ix_{tablename}_minute_chat_id", "minute", "chat_id"),
+        )
+        self.subscriptions_t.create(self.engine, checkfirst=True)
+
+    def replace(self, user_id: int, chat_id: int, minutes: Iterable[int]) -> bool:
+        """Subscribe a user, returning whether they had subscriptions already."""
+        subscriptions_t = self.subscriptions_t
+        with self.engine.begin() as connection:
+            removed = connection.execute(
+                subscriptions_t.delete().where(subscriptions_t.c.user_id == user_id)
+            ).rowcount
+            rows = [
+                {"user_id": user_id, "minute": minute, "chat_id": chat_id}
+                for minute in sorted(set(minutes))
+            ]
+            if rows:
+                connection.execute(subscriptions_t.insert(), rows)
+        return removed > 0
+
+    def add(self, subscriptions: Dict[int, Dict[int, int]]) -> None:
+        """Add minutes to users' subscriptions, given as {user: {minute: chat}}."""
+        subscriptions_t = self.subscriptions_t
+        with self.engine.begin() as connection:
+            for user_id, chats in subscriptions.items():
+                existing = {
+                    row.minute
+                    for row in connection.execute(
+                        select(subscriptions_t.c.minute).where(
+                            subscriptions_t.c.user_id == user_id
+                        )
+                    )
+                }
+                rows = [
+                    {"user_id": user_id, "minute": minute, "chat_id": chat_id}
+                    for minute, chat_id in chats.items()
+                    if minute not in existing
+                ]
+                if rows:
+                    connection.execute(subscriptions_t.insert(), rows)
+
+    def minutes(self) -> List[int]:
+        subscriptions_t = self.subscriptions_t
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                select(subscriptions_t.c.minute)
+                .distinct()
+                .order_by(subscriptions_t.c.minute)
+            ).all()
+        return [row.minute for row in rows]
+
+    def chat_ids(self, minute: int) -> List[int]:
+        subscriptions_t = self.subscriptions_t
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                select(subscriptions_t.c.chat_id)
+                .distinct()
+                .where(subscriptions_t.c.minute == minute)
+            ).all()
+        return [row.chat_id for row in rows]
+
+    def remove_chat(self, chat_id: int) -> None:
+        subscriptions_t = self.subscriptions_t
+        with self.engine.begin() as connection:
+            connection.execute(
+                subscriptions_t.delete().where(subscriptions_t.c.chat_id == chat_id)
+            )
@@ -0,0 +1,228 @@
+import datetime
+from typing import List, Optional
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    create_engine,
+    DateTime,
+    Integer,
+    MetaData,
+    select,
+    String,
+    Table,
+)
+from sqlalchemy.exc import IntegrityError
+
+from core.leaderboard_entrants import LeaderboardEntrant
+from core.league_standing import LeagueStanding
+from core.user import User
+
+
+class RaceSnapshotStore:
+    """
+    League standings and team lineups of completed races, whose results never
+    change once final. Every table has (league_id, race_id) as the leading
+    columns of its primary key, so each read is a range scan of that index.
+    A standing snapshot records how many entrants it holds and whether that is
+    the whole league, so a top-N read can tell if it is covered. Lineups only
+    hold the ids of the players picked, scored with the drivers catalog when
+    read, so points revised after the race are never frozen in.
+    """
+
+    def __init__(self, url: str, tablename_prefix: str = "f1_fantasy_race"):
+        self.engine = create_engine(url)
+        metadata = MetaData()
+        self.standing_snapshots_t = Table(
+            f"{tablename_prefix}_standing_snapshots",
+            metadata,
+            Column("league_id", String(64), primary_key=True),
+            Column("race_id", Integer, primary_key=True, autoincrement=False),
+            Column("entrants", Integer, nullable=False),
+            Column("complete", Boolean, nullable=False),
+            Column("created_at", DateTime(timezone=True), nullable=False),
+        )
+        self.standings_t = Table(
+            f"{tablename_prefix}_standings",
+            metadata,
+            Column("league_id", String(64), primary_key=True),
+            Column("race_id", Integer, primary_key=True, autoincrement=False),
+            Column("position", Integer, primary_key=True, autoincrement=False),
+            Column("user_id", String(191), nullable=False),
+            Column("username", String(191), nullable=False),
+            Column("team_name", String(191), nullable=False),
+            Column("score", String(32), nullable=False),
+        )
+        self.lineups_t = Table(
+            f"{tablename_prefix}_lineups",
+            metadata,
+            Column("league_id", String(64), primary_key=True),
+            Column("race_id", Integer, primary_key=True, autoincrement=False),
+            Column("user_id", String(191), primary_key=True),
+            Column("position", Integer, primary_key=True, autoincrement=False),
+            Column("player_id", String(32), nullable=False),
+        )
+        metadata.create_all(self.engine, checkfirst=True)
+
+    def load_standing(
+        self, league_id: str, race_id: int, limit: Optional[int] = None
+    ) -> Optional[LeagueStanding]:
+        """The top `limit` entrants, or None if the snapshot doesn't cover them."""
+        snapshots_t, standings_t = self.standing_snapshots_t, self.standings_t
+        with self.engine.begin() as connection:
+            snapshot = connection.execute(
+                select(snapshots_t.c.entrants, snapshots_t.c.complete).where(
+                    snapshots_t.c.league_id == league_id,
+                    snapshots_t.c.race_id == race_id,
+                )
+            ).first()
+            if snapshot is None or (
+                not snapshot.complete and (limit is None or snapshot.entrants < limit)
+            ):
+                return None
+            rows = connection.execute(
+                select(
+                    standings_t.c.user_id,
+                    standings_t.c.username,
+                    standings_t.c.team_name,
+                    standings_t.c.score,
+                )
+                .where(
+                    standings_t.c.league_id == league_id,
+                    standings_t.c.race_id == race_id,
+                )
+                .order_by(standings_t.c.position)
+                .limit(limit)
+            ).all()
+        return LeagueStanding(
+            entrants=[
+                LeaderboardEntrant(
+                    user=User(username=row.username, user_id=row.user_id),
+                    score=row.score,
+                    team_name=row.team_name,
+                )
+                for row in rows
+            ]
+        )
+
+    def save_standing(
+        self,
+        league_id: str,
+        race_id: int,
+        entrants: List[LeaderboardEntrant],
+        complete: bool,
+    ) -> None:
+        """
+        Store a standing, unless a snapshot as large and as complete, or larger,
+        is already there.
+        """
+        snapshots_t, standings_t = self.standing_snapshots_t, self.standings_t
+        key = (snapshots_t.c.league_id == league_id) & (
+            snapshots_t.c.race_id == race_id
+        )
+        try:
+            with self.engine.begin() as connection:
+                snapshot = connection.execute(
+                    select(snapshots_t.c.entrants, snapshots_t.c.complete)
+                    .where(key)
+                    .with_for_update()
+                ).first()
+                if snapshot is not None:
+                    if snapshot.complete or snapshot.entrants > len(entrants):
+                        return
+                    if snapshot.entrants == len(entrants):
+                        if complete:
+                            # The same entrants, now known to be all of them.
+                            connection.execute(
+                                snapshots_t.update().where(key).values(complete=True)
+                            )
+                        return
+                    connection.execute(snapshots_t.delete().where(key))
+                    connection.execute(
+                        standings_t.delete().where(
+                            standings_t.c.league_id == league_id,
+                            standings_t.c.race_id == race_id,
+                        )
+                    )
+                connection.execute(
+                    snapshots_t.insert().values(
+                        league_id=league_id,
+                        race_id=race_id,
+                        entrants=len(entrants),
+                        complete=complete,
+                        created_at=datetime.datetime.now(tz=datetime.timezone.utc),
+                    )
+                )
+                if entrants:
+                    connection.execute(
+                        standings_t.insert(),
+                        [
+                            {
+                                "league_id": league_id,
+                                "race_id": race_id,
+                                "position": position,
+                                "user_id": e.user.user_id,
+                                "username": e.user.username,
+                                "team_name": e.team_name,
+                                "score": str(e.score),
+                            }
+                            for position, e in enumerate(entrants)
+                        ],
+                    )
+        except IntegrityError:
+            # Saved concurrently by another request: keep that one.
+            pass
+
+    def load_lineup(
+        self, league_id: str, race_id: int, user_id: str
+    ) -> Optional[List[str]]:
+        """The ids of the players picked, or None if not snapshotted."""
+        lineups_t = self.lineups_t
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                select(lineups_t.c.player_id)
+                .where(
+                    lineups_t.c.league_id == league_id,
+                    lineups_t.c.race_id == race_id,
+                    lineups_t.c.user_id == user_id,
+                )
+                .order_by(lineups_t.c.position)
+            ).all()
+        if not rows:
+            return None
+        return [row.player_id for row in rows]
+
+    def save_lineup(
+        self,
+        league_id: str,
+        race_id: int,
+        user_id: str,
+        player_ids: List[str],
+    ) -> None:
+        lineups_t = self.lineups_t
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    lineups_t.delete().where(
+                        lineups_t.c.league_id == league_id,
+                        lineups_t.c.race_id == race_id,
+                        lineups_t.c.user_id == user_id,
+                    )
+                )
+                if player_ids:
+                    connection.execute(
+                        lineups_t.insert(),
+                        [
+                            {
+                                "league_id": league_id,
+                                "race_id": race_id,
+                                "user_id": user_id,
+                                "position": position,
+                                "player_id": player_id,
+                            }
+                            for position, player_id in enumerate(player_ids)
+                        ],
+                    )
+        except IntegrityError:
+            # Saved concurrently by another request: keep that one.
+            pass
@@ -0,0 +1,75 @@
+import datetime
+import logging
+from typing import Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy import (
+    Column,
+    create_engine,
+    DateTime,
+    LargeBinary,
+    MetaData,
+    select,
+    String,
+    Table,
+)
+
+from core.session import Session
+
+logger = logging.getLogger(name=__name__)
+logger.setLevel(level="DEBUG")
+
+
+class SessionStore:
+    """
+    Persists the F1 Fantasy login session so a restart can reuse it instead of
+    logging in again through the browser. The cookie is encrypted at rest with
+    Fernet.
+    """
+
+    def __init__(
+        self, url: str, encryption_key: str, tablename: str = "f1_fantasy_sessions"
+    ):
+        self.engine = create_engine(url)
+        self.fernet = Fernet(encryption_key)
+        self.sessions_t = Table(
+            tablename,
+            MetaData(),
+            Column("account", String(191), primary_key=True),
+            Column("cookie", LargeBinary, nullable=False),
+            Column("expires_at", DateTime(timezone=True), nullable=True),
+            Column("updated_at", DateTime(timezone=True), nullable=False),
+        )
+        self.sessions_t.create(self.engine, checkfirst=True)
+
+    def load(self, account: str) -> Optional[Session]:
+        selectable = select(
+            self.sessions_t.c.cookie, self.sessions_t.c.expires_at
+        ).where(self.sessions_t.c.account == account)
+        with self.engine.begin() as connection:
+            row = connection.execute(selectable).first()
+        if row is None:
+            return None
+        try:
+            cookie = self.fernet.decrypt(row.cookie).decode("utf-8")
+        except InvalidToken:
+            logger.warning("Stored session can't be decrypted, ignoring it")
+            return None
+        return Session(cookie=cookie, expires_at=row.expires_at)
+
+    def save(self, account: str, session: Session) -> None:
+        values = {
+            "cookie": self.fernet.encrypt(session.cookie.encode("utf-8")),
+            "expires_at": session.expires_at,
+            "updated_at": datetime.datetime.now(tz=datetime.timezone.utc),
+        }
+        with self.engine.begin() as connection:
+            updated = connection.execute(
+                self.sessions_t.update()
+                .where(self.sessions_t.c.account == account)
+                .values(**values)
+            )
+            if updated.rowcount == 0:
+                connection.execute(
+                    self.sessions_t.insert().values(account=account, **values)
+                )
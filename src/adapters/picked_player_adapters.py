@@ -1,27 +1,42 @@
-from typing import List
+from collections import Counter
+from typing import Dict, Hashable, List
 
 import prettytable as pt
+from core.driver import Driver
+from core.league_standing import LeagueStanding
 from core.picked_player import PickedPlayer
 from core.race import Race
 
 
-def to_picked_players(players: dict):
+def to_picked_players(players: Dict[int, Driver]):
     def from_json_to_picked_players(json: dict) -> List[PickedPlayer]:
-        return [
-            to_picked_player(picked_player, players)
-            for picked_player in json["Data"]["Value"]["userTeam"][0]["playerid"]
-        ]
+        return lineup_to_picked_players(to_lineup(json), players)
 
     return from_json_to_picked_players
 
 
-def to_picked_player(json: dict, players: dict) -> PickedPlayer:
+def to_lineup(json: dict) -> List[str]:
+    """The ids of the players picked, which are scored with the drivers catalog."""
+    return [
+        str(picked_player["id"])
+        for picked_player in json["Data"]["Value"]["userTeam"][0]["playerid"]
+    ]
+
+
+def lineup_to_picked_players(
+    player_ids: List[str], players: Dict[int, Driver]
+) -> List[PickedPlayer]:
+    return [to_picked_player(player_id, players) for player_id in player_ids]
+
+
+def to_picked_player(player_id: str, players: Dict[int, Driver]) -> PickedPlayer:
+    driver = players[int(player_id)]
     return PickedPlayer(
-        player_id=json["id"],
-        player_name=players[int(json["id"])]["DisplayName"],
-        team_name=players[int(json["id"])]["TeamName"],
-        team_abbreviation=players[int(json["id"])]["TeamName"],
-        score=players[int(json["id"])]["GamedayPoints"],
+        player_id=player_id,
+        player_name=driver.display_name,
+        team_name=driver.team_name,
+        team_abbreviation=driver.team_name,
+        score=driver.gameday_points,
     )
 
 
@@ -40,3 +55,79 @@ def picked_players_to_pretty_table(
             ]
         )
     return table
+
+
+def picked_players_to_html(picked_players: List[PickedPlayer], last_race: Race) -> str:
+    table = picked_players_to_pretty_table(
+        picked_players=picked_players, last_race=last_race
+    )
+    return f"<pre>{table}</pre>"
+
+
+def picked_players_fingerprint(
+    picked_players: List[PickedPlayer], last_race: Race
+) -> Hashable:
+    return (
+        "picked_players",
+        last_race.name,
+        tuple((p.player_name, p.team_abbreviation, p.score) for p in picked_players),
+    )
+
+
+def league_lineups_to_pretty_tables(
+    standing: LeagueStanding,
+    lineups: Dict[str, List[PickedPlayer]],
+    last_race: Race,
+    most_picked_limit: int = 10,
+) -> List[pt.PrettyTable]:
+    teams_table = pt.PrettyTable()
+    teams_table.title = last_race.name
+    teams_table.field_names = ["Username", "Points", "Best pick"]
+    picks: Counter = Counter()
+    for e in standing.entrants:
+        picked_players = lineups.get(e.user.user_id)
+        if picked_players is None:
+            continue
+        picks.update(p.player_name for p in picked_players)
+        best_pick = max(picked_players, key=lambda p: p.score, default=None)
+        teams_table.add_row(
+            [e.user.username, e.score, best_pick.player_name if best_pick else "-"]
+        )
+
+    most_picked_table = pt.PrettyTable()
+    most_picked_table.title = "Most picked"
+    most_picked_table.field_names = ["Name", "Picks"]
+    for player_name, count in picks.most_common(most_picked_limit):
+        most_picked_table.add_row([player_name, count])
+    return [teams_table, most_picked_table]
+
+
+def pretty_tables_to_html_messages(
+    tables: List[pt.PrettyTable], max_length: int
+) -> List[str]:
+    """
+    The tables as <pre> blocks in as few messages of at most max_length as
+    possible, a table too long for one message being split between its lines.
+    """
+    room = max_length - len("<pre></pre>")
+    blocks = []
+    for table in tables:
+        lines: List[str] = []
+        size = 0
+        for line in table.get_string().splitlines():
+            if lines and size + 1 + len(line) > room:
+                blocks.append("\n".join(lines))
+                lines, size = [], 0
+            size += len(line) + (1 if lines else 0)
+            lines.append(line)
+        if lines:
+            blocks.append("\n".join(lines))
+
+    messages: List[str] = []
+    for block in blocks:
+        html = f"<pre>{block}</pre>"
+        if messages and len(messages[-1]) + len(html) <= max_length:
+            messages[-1] += html
+        else:
+            messages.append(html)
+    return messages
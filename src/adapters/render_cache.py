@@ -0,0 +1,26 @@
+from typing import Callable, Hashable
+
+from services.cache import LRUCache
+
+
+class RenderCache:
+    """
+    Rendered messages keyed by a fingerprint of the data they show, so the same
+    standing requested by many chats is rendered only once.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.cache: LRUCache[str] = LRUCache(max_entries=max_entries)
+
+    def render(self, key: Hashable, render: Callable[[], str]) -> str:
+        message = self.cache.get(key)
+        if message is None:
+            message = render()
+            self.cache.put(key, message, ttl=None)
+        return message
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,49 @@
+import prettytable as pt
+
+from core.standings_history import StandingsHistory
+
+
+def _points(value: float) -> str:
+    return f"{value:g}"
+
+
+def _change(value: int) -> str:
+    return f"+{value}" if value > 0 else str(value) if value < 0 else "="
+
+
+def leaders_trend_to_html(history: StandingsHistory, limit: int = 10) -> str:
+    table = pt.PrettyTable(["Pos", "Username", "Total", "Form", "Gap", "+/-"])
+    table.title = f"Trend after {history.races[-1].name}"
+    changes = history.position_changes()
+    for row in history.leaders(limit):
+        table.add_row(
+            [
+                history.positions[row, -1],
+                history.usernames[row],
+                _points(history.totals[row, -1]),
+                f"{history.form[row, -1]:.1f}",
+                _points(history.gaps[row, -1]),
+                _change(changes[row]),
+            ]
+        )
+    return f"<pre>{table}</pre>"
+
+
+def entrant_trend_to_html(history: StandingsHistory, row: int) -> str:
+    table = pt.PrettyTable(["Race", "Pts", "Rank", "Total", "Pos", "Gap"])
+    table.title = (
+        f"{history.usernames[row]} - form {history.form[row, -1]:.1f} "
+        f"over the last {history.form_window} races"
+    )
+    for column, race in enumerate(history.races):
+        table.add_row(
+            [
+                race.name,
+                _points(history.points[row, column]),
+                history.race_ranks[row, column],
+                _points(history.totals[row, column]),
+                history.positions[row, column],
+                _points(history.gaps[row, column]),
+            ]
+        )
+    return f"<pre>{table}</pre>"
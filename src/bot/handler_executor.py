@@ -0,0 +1,79 @@
+import logging
+import queue
+import threading
+from typing import Callable, List
+
+from metrics import HANDLER_SHED
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import CallbackContext
+
+BUSY_TEXT = "I'm busy right now, please try again in a moment"
+
+
+class HandlerExecutor:
+    """
+    Runs the handlers that wait on I/O on a pool of workers of their own, so
+    that the dispatcher thread is never blocked on them and keeps answering the
+    handlers run inline, like /help. Up to queue_size updates wait for a
+    worker, the next ones are answered busy instead. Without workers, handlers
+    run on the dispatcher thread.
+    """
+
+    def __init__(self, workers: int, queue_size: int, logger: logging.Logger):
+        self.workers = workers
+        self.logger = logger
+        self.queue: queue.Queue = queue.Queue()
+        # Counts the updates running as well, not to depend on how quickly
+        # the workers take them from the queue.
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"handler-worker-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> None:
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def io_bound(self, command: str, callback: Callable) -> Callable:
+        if not self.workers:
+            return callback
+        shed = HANDLER_SHED.labels(command=command)
+
+        def submit(update: Update, context: CallbackContext) -> None:
+            if not self.slots.acquire(blocking=False):
+                shed.inc()
+                self._reply_busy(update)
+                return
+            self.queue.put((callback, update, context))
+
+        return submit
+
+    def _work(self) -> None:
+        for callback, update, context in iter(self.queue.get, None):
+            try:
+                callback(update, context)
+            except Exception as e:
+                # Errors raised on the dispatcher thread go to its handlers too.
+                context.dispatcher.dispatch_error(update, e)
+            finally:
+                self.slots.release()
+
+    def _reply_busy(self, update: Update) -> None:
+        try:
+            if update.callback_query is not None:
+                update.callback_query.answer(text=BUSY_TEXT)
+            elif update.effective_message is not None:
+                update.effective_message.reply_text(BUSY_TEXT)
+        except TelegramError as e:
+            self.logger.warning(f"Unable to answer busy: {e}")
@@ -1,25 +1,48 @@
 import datetime
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 
 from adapters.leaderboard_adapters import (
     entrant_to_pretty_input,
-    league_standing_to_pretty_table,
+    league_standing_fingerprint,
+    league_standing_to_html,
+    standing_age_to_html,
 )
-from adapters.picked_player_adapters import picked_players_to_pretty_table
+from adapters.picked_player_adapters import (
+    league_lineups_to_pretty_tables,
+    picked_players_fingerprint,
+    picked_players_to_html,
+    pretty_tables_to_html_messages,
+)
+from adapters.render_cache import RenderCache
+from adapters.standings_history_adapters import (
+    entrant_trend_to_html,
+    leaders_trend_to_html,
+)
+from bot.handler_executor import HandlerExecutor
+from bot.lineup_reminders import LineupReminderScheduler
 from bot.telegram_command import (
     COMMANDS,
     TELEGRAM_FANTASY_LAST_GP_STANDING_COMMAND,
+    TELEGRAM_FANTASY_LEAGUE_LINEUPS_COMMAND,
     TELEGRAM_FANTASY_LINEUP_REMINDER,
     TELEGRAM_FANTASY_STANDING_COMMAND,
     TELEGRAM_FANTASY_TEAM_COMMAND,
+    TELEGRAM_FANTASY_TREND_COMMAND,
     TELEGRAM_HELP_COMMAND,
     TELEGRAM_START_COMMAND,
 )
 from core.error import Error
+from core.lineup_reminder import MAX_LINEUP_REMINDER_MINUTES
+from core.league_standing import LeagueStanding
+from metrics import timed_handler
+from services.drivers_catalog import DriversCatalog
 from services.f1_fantasy_service import F1FantasyService
+from services.race_calendar_service import RaceCalendarService
+from services.standings_history_service import StandingsHistoryService
 
 from telegram import InlineKeyboardMarkup, ParseMode, Update
+from telegram.constants import MAX_MESSAGE_LENGTH
 from telegram.ext import CallbackContext, CallbackQueryHandler, CommandHandler, Handler
 
 logger = logging.getLogger(__name__)
@@ -39,7 +62,9 @@ def help_bot_handler():
     return help_message
 
 
-def get_standings_handler(f1_fantasy_service: F1FantasyService):
+def get_standings_handler(
+    f1_fantasy_service: F1FantasyService, render_cache: RenderCache
+):
     def get_f1_fantasy_standings(update: Update, context: CallbackContext):
         league_standing = f1_fantasy_service.get_league_standing()
         if isinstance(league_standing, Error):
@@ -48,10 +73,13 @@ def get_standings_handler(f1_fantasy_service: F1FantasyService):
                 text="It wasn't possible to retrieve the standing",
             )
         else:
-            message = league_standing_to_pretty_table(standing=league_standing)
+            message = render_cache.render(
+                key=league_standing_fingerprint(standing=league_standing),
+                render=lambda: league_standing_to_html(standing=league_standing),
+            )
             context.bot.send_message(
                 chat_id=update.effective_chat.id,
-                text=f"<pre>{message}</pre>",
+                text=message + standing_age_to_html(league_standing),
                 parse_mode=ParseMode.HTML,
             )
 
@@ -59,14 +87,17 @@ def get_standings_handler(f1_fantasy_service: F1FantasyService):
 
 
 def get_last_race_standing_handler(
-    now: datetime.datetime,
+    race_calendar_service: RaceCalendarService,
     f1_fantasy_service: F1FantasyService,
+    render_cache: RenderCache,
 ):
     def get_last_f1_fantasy_race_standing(update: Update, context: CallbackContext):
         default_error_message = "It wasn't possible to retrieve the standing"
 
-        last_race = f1_fantasy_service.get_last_completed_race(now=now)
-        if isinstance(last_race, Error):
+        last_race = race_calendar_service.calendar.last_completed(
+            now=datetime.datetime.now()
+        )
+        if last_race is None:
             context.bot.send_message(
                 chat_id=update.effective_chat.id, text=default_error_message
             )
@@ -79,11 +110,17 @@ def get_last_race_standing_handler(
                     chat_id=update.effective_chat.id, text=default_error_message
                 )
             else:
-                message = league_standing_to_pretty_table(standing=last_race_standings)
-                message.title = last_race.name
+                message = render_cache.render(
+                    key=league_standing_fingerprint(
+                        standing=last_race_standings, title=last_race.name
+                    ),
+                    render=lambda: league_standing_to_html(
+                        standing=last_race_standings, title=last_race.name
+                    ),
+                )
                 context.bot.send_message(
                     chat_id=update.effective_chat.id,
-                    text=f"<pre>{message}</pre>",
+                    text=message + standing_age_to_html(last_race_standings),
                     parse_mode=ParseMode.HTML,
                 )
 
@@ -104,9 +141,10 @@ def get_last_race_team_standing_handler(f1_fantasy_service: F1FantasyService):
 
 
 def get_last_race_team_standing_handler_button(
-    now: datetime.datetime,
-    f1_all_players: dict,
+    race_calendar_service: RaceCalendarService,
+    drivers_catalog: DriversCatalog,
     f1_fantasy_service: F1FantasyService,
+    render_cache: RenderCache,
 ):
     def get_f1_last_race_team_standing_handler_button(
         update: Update, context: CallbackContext
@@ -116,130 +154,283 @@ def get_last_race_team_standing_handler_button(
         query.answer()
         user_global_id = query.data
 
-        # season parameter hardcoded to current year at the moment
-        last_race = f1_fantasy_service.get_last_completed_race(now=now)
+        last_race = race_calendar_service.calendar.last_completed(
+            now=datetime.datetime.now()
+        )
+        if last_race is None:
+            query.edit_message_text(text="There are no completed races")
+            return
         picked_players = f1_fantasy_service.get_last_race_team_standing(
-            race_id=last_race.id, user_id=user_global_id, f1_drivers=f1_all_players
+            race_id=last_race.id,
+            user_id=user_global_id,
+            f1_drivers=drivers_catalog.drivers,
         )
-        message = picked_players_to_pretty_table(
-            picked_players=picked_players, last_race=last_race
+        if isinstance(picked_players, Error):
+            query.edit_message_text(text="It wasn't possible to retrieve the team")
+            return
+        message = render_cache.render(
+            key=picked_players_fingerprint(
+                picked_players=picked_players, last_race=last_race
+            ),
+            render=lambda: picked_players_to_html(
+                picked_players=picked_players, last_race=last_race
+            ),
         )
 
         query.edit_message_text(
-            text=f"<pre>{message}</pre>",
+            text=message,
             parse_mode=ParseMode.HTML,
         )
 
     return get_f1_last_race_team_standing_handler_button
 
 
-def get_valid_lineup_reminder_minutes(minutes: List[str]) -> List[float]:
+def get_last_race_league_lineups_handler(
+    race_calendar_service: RaceCalendarService,
+    drivers_catalog: DriversCatalog,
+    f1_fantasy_service: F1FantasyService,
+):
+    def get_last_f1_fantasy_race_league_lineups(
+        update: Update, context: CallbackContext
+    ):
+        default_error_message = "It wasn't possible to retrieve the lineups"
+
+        last_race = race_calendar_service.calendar.last_completed(
+            now=datetime.datetime.now()
+        )
+        if last_race is None:
+            context.bot.send_message(
+                chat_id=update.effective_chat.id, text=default_error_message
+            )
+            return
+        entrants = []
+        for entrant in f1_fantasy_service.iter_last_race_standing(race_id=last_race.id):
+            if isinstance(entrant, Error):
+                context.bot.send_message(
+                    chat_id=update.effective_chat.id, text=default_error_message
+                )
+                return
+            entrants.append(entrant)
+
+        team_standings = f1_fantasy_service.get_last_race_team_standings(
+            race_id=last_race.id,
+            user_ids=[e.user.user_id for e in entrants],
+            f1_drivers=drivers_catalog.drivers,
+        )
+        lineups = {
+            user_id: picked_players
+            for user_id, picked_players in team_standings.items()
+            if not isinstance(picked_players, Error)
+        }
+        if not lineups:
+            context.bot.send_message(
+                chat_id=update.effective_chat.id, text=default_error_message
+            )
+            return
+        tables = league_lineups_to_pretty_tables(
+            standing=LeagueStanding(entrants=entrants),
+            lineups=lineups,
+            last_race=last_race,
+        )
+        for text in pretty_tables_to_html_messages(tables, MAX_MESSAGE_LENGTH):
+            context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=text,
+                parse_mode=ParseMode.HTML,
+            )
+
+    return get_last_f1_fantasy_race_league_lineups
+
+
+def get_valid_lineup_reminder_minutes(
+    minutes: Optional[List[str]],
+) -> Tuple[List[int], List[str]]:
+    """The minutes, rounded, and the arguments rejected."""
     if not minutes:
-        return [30]
+        return [30], []
 
-    final_minutes = []
+    final_minutes: List[int] = []
+    rejected = []
     for minute in minutes:
         try:
-            m = float(minute)
-            if m > 0:
-                final_minutes.append(m)
-        except (IndexError, ValueError):
-            pass
-    return final_minutes
+            m = round(float(minute))
+        except (OverflowError, ValueError):
+            rejected.append(minute)
+            continue
+        if not 0 < m <= MAX_LINEUP_REMINDER_MINUTES:
+            rejected.append(minute)
+        elif m not in final_minutes:
+            final_minutes.append(m)
+    return final_minutes, rejected
 
 
 def set_lineup_reminders_handler(
-    f1_fantasy_service: F1FantasyService, now: datetime.datetime
+    race_calendar_service: RaceCalendarService,
+    lineup_reminder_scheduler: LineupReminderScheduler,
 ):
     def set_lineup_reminders(update: Update, context: CallbackContext):
 
-        minutes = get_valid_lineup_reminder_minutes(context.args)
+        minutes, rejected = get_valid_lineup_reminder_minutes(context.args)
+        if rejected:
+            update.message.reply_text(
+                f"Ignoring {', '.join(rejected)}: reminders can be set from 1 to "
+                f"{MAX_LINEUP_REMINDER_MINUTES} minutes before the deadline."
+            )
+        if not minutes:
+            return
 
-        season_races = f1_fantasy_service.get_season_races(season=now.year)
-        next_races = list(filter(lambda r: r.start_timestamp > now, season_races))
+        next_races = race_calendar_service.calendar.races_after(datetime.datetime.now())
 
         chat_id = update.message.chat_id
         user_id = update.effective_user.id
-        job_removed = False
 
         update.message.reply_text("Setting reminder...")
-        for race in next_races:
-            job_name = f"{race.id}-{user_id}"
-            # Schedule the reminders only if not already present
-            for minute in minutes:
-                remind_at = race.start_timestamp - datetime.timedelta(
-                    minutes=minute
-                )
-                job_removed = remove_job_if_exists(job_name, context)
-                context.job_queue.run_once(
-                    callback=send_lineup_reminder,
-                    when=remind_at,
-                    context=str(chat_id),
-                    name=job_name,
-                )
+        replaced = lineup_reminder_scheduler.subscribe(
+            user_id=user_id,
+            chat_id=chat_id,
+            races=next_races,
+            minutes=minutes,
+        )
         text = f"I will remind you {minutes} before the deadline."
-        if job_removed:
+        if replaced:
             text += "\nOld reminders were removed."
         update.message.reply_text(text)
 
     return set_lineup_reminders
 
 
-def remove_job_if_exists(name: str, context: CallbackContext) -> bool:
-    """Remove job with given name. Returns whether job was removed."""
-    logger.debug("Remove job")
-    current_jobs = context.job_queue.get_jobs_by_name(name)
-    if not current_jobs:
-        return False
-    for job in current_jobs:
-        job.schedule_removal()
-    return True
+def get_trend_handler(standings_history_service: StandingsHistoryService):
+    def get_f1_fantasy_trend(update: Update, context: CallbackContext):
+        history = standings_history_service.history
+        if not history.races:
+            context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text="The trend is not available yet",
+            )
+            return
+        if context.args:
+            username = " ".join(context.args)
+            row = history.find(username)
+            if row is None:
+                context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text=f"There is no team of {username} in the league",
+                )
+                return
+            message = entrant_trend_to_html(history=history, row=row)
+        else:
+            message = leaders_trend_to_html(history=history)
+        context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=message,
+            parse_mode=ParseMode.HTML,
+        )
+
+    return get_f1_fantasy_trend
 
 
 # FIXME: find a way to use what is in telegram_command.py to avoid duplication
 def get_handlers(
-    drivers: dict,
+    drivers_catalog: DriversCatalog,
     f1_fantasy_service: F1FantasyService,
+    race_calendar_service: RaceCalendarService,
+    render_cache: RenderCache,
+    standings_history_service: StandingsHistoryService,
+    lineup_reminder_scheduler: LineupReminderScheduler,
+    handler_executor: HandlerExecutor,
 ) -> List[Handler]:
+    # Handlers that only read memory run inline, the others on the executor.
+    io_bound = handler_executor.io_bound
     return [
         CommandHandler(
             [TELEGRAM_START_COMMAND, TELEGRAM_HELP_COMMAND],
-            help_bot_handler(),
+            timed_handler(TELEGRAM_HELP_COMMAND, help_bot_handler()),
         ),
         CommandHandler(
             TELEGRAM_FANTASY_STANDING_COMMAND,
-            get_standings_handler(f1_fantasy_service=f1_fantasy_service),
+            io_bound(
+                TELEGRAM_FANTASY_STANDING_COMMAND,
+                timed_handler(
+                    TELEGRAM_FANTASY_STANDING_COMMAND,
+                    get_standings_handler(
+                        f1_fantasy_service=f1_fantasy_service,
+                        render_cache=render_cache,
+                    ),
+                ),
+            ),
         ),
         CommandHandler(
             TELEGRAM_FANTASY_LAST_GP_STANDING_COMMAND,
-            get_last_race_standing_handler(
-                now=datetime.datetime.now(),
-                f1_fantasy_service=f1_fantasy_service,
+            io_bound(
+                TELEGRAM_FANTASY_LAST_GP_STANDING_COMMAND,
+                timed_handler(
+                    TELEGRAM_FANTASY_LAST_GP_STANDING_COMMAND,
+                    get_last_race_standing_handler(
+                        race_calendar_service=race_calendar_service,
+                        f1_fantasy_service=f1_fantasy_service,
+                        render_cache=render_cache,
+                    ),
+                ),
             ),
         ),
         CommandHandler(
             TELEGRAM_FANTASY_TEAM_COMMAND,
-            get_last_race_team_standing_handler(f1_fantasy_service=f1_fantasy_service),
+            io_bound(
+                TELEGRAM_FANTASY_TEAM_COMMAND,
+                timed_handler(
+                    TELEGRAM_FANTASY_TEAM_COMMAND,
+                    get_last_race_team_standing_handler(
+                        f1_fantasy_service=f1_fantasy_service
+                    ),
+                ),
+            ),
         ),
         CallbackQueryHandler(
-            get_last_race_team_standing_handler_button(
-                now=datetime.datetime.now(),
-                f1_all_players=drivers,
-                f1_fantasy_service=f1_fantasy_service,
+            io_bound(
+                f"{TELEGRAM_FANTASY_TEAM_COMMAND}_button",
+                timed_handler(
+                    f"{TELEGRAM_FANTASY_TEAM_COMMAND}_button",
+                    get_last_race_team_standing_handler_button(
+                        race_calendar_service=race_calendar_service,
+                        drivers_catalog=drivers_catalog,
+                        f1_fantasy_service=f1_fantasy_service,
+                        render_cache=render_cache,
+                    ),
+                ),
             )
         ),
+        CommandHandler(
+            TELEGRAM_FANTASY_LEAGUE_LINEUPS_COMMAND,
+            io_bound(
+                TELEGRAM_FANTASY_LEAGUE_LINEUPS_COMMAND,
+                timed_handler(
+                    TELEGRAM_FANTASY_LEAGUE_LINEUPS_COMMAND,
+                    get_last_race_league_lineups_handler(
+                        race_calendar_service=race_calendar_service,
+                        drivers_catalog=drivers_catalog,
+                        f1_fantasy_service=f1_fantasy_service,
+                    ),
+                ),
+            ),
+        ),
+        CommandHandler(
+            TELEGRAM_FANTASY_TREND_COMMAND,
+            timed_handler(
+                TELEGRAM_FANTASY_TREND_COMMAND,
+                get_trend_handler(standings_history_service=standings_history_service),
+            ),
+        ),
         CommandHandler(
             TELEGRAM_FANTASY_LINEUP_REMINDER,
-            set_lineup_reminders_handler(
-                now=datetime.datetime.now(),
-                f1_fantasy_service=f1_fantasy_service,
+            io_bound(
+                TELEGRAM_FANTASY_LINEUP_REMINDER,
+                timed_handler(
+                    TELEGRAM_FANTASY_LINEUP_REMINDER,
+                    set_lineup_reminders_handler(
+                        race_calendar_service=race_calendar_service,
+                        lineup_reminder_scheduler=lineup_reminder_scheduler,
+                    ),
+                ),
             ),
         ),
     ]
-
-
-def send_lineup_reminder(context: CallbackContext) -> None:
-    job = context.job
-    context.bot.send_message(
-        job.context, text="Hey buddy, it's time to make the lineup for the upcoming GP!"
-    )
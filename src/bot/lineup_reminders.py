@@ -0,0 +1,177 @@
+import datetime
+import functools
+import logging
+from concurrent.futures import Future
+from typing import Dict, List, Optional, cast
+
+from adapters.persistence.jobstore import PTBSQLAlchemyJobStore
+from adapters.persistence.lineup_reminder_subscription_store import (
+    LineupReminderSubscriptionStore,
+)
+from apscheduler.job import Job as APSJob
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.util import utc_timestamp_to_datetime
+from bot.outbound_messages import BULK, ScheduledBot
+from core.lineup_reminder import (
+    lineup_reminder_job_name,
+    parse_lineup_reminder_job_name,
+)
+from core.race import Race
+
+from telegram import Message
+from telegram.error import Unauthorized
+from telegram.ext import CallbackContext, Job, JobQueue
+
+LINEUP_REMINDER_TEXT = "Hey buddy, it's time to make the lineup for the upcoming GP!"
+BOT_DATA_KEY = "lineup_reminder_scheduler"
+
+
+def send_lineup_reminders(context: CallbackContext) -> None:
+    # Jobs are stored with a reference to their callback, so it has to be a
+    # module function: the scheduler is found in bot_data.
+    context.bot_data[BOT_DATA_KEY].broadcast(context)
+
+
+class LineupReminderScheduler:
+    """
+    Lineup reminders are one job per race and minutes before the deadline, so
+    their number doesn't grow with the users. When a job fires it notifies all
+    the chats subscribed to its minute, as bulk messages of the outbound
+    scheduler that keeps them within the Telegram broadcast limits.
+    """
+
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        jobstore: PTBSQLAlchemyJobStore,
+        subscription_store: LineupReminderSubscriptionStore,
+        logger: logging.Logger,
+    ):
+        self.job_queue = job_queue
+        self.jobstore = jobstore
+        self.subscription_store = subscription_store
+        self.logger = logger
+        jobstore.dispatcher.bot_data[BOT_DATA_KEY] = self
+
+    def start(self, races: List[Race]) -> None:
+        """To be called once the job queue is running, before any job fires."""
+        self._migrate_user_reminders(races)
+        self.schedule(races)
+
+    def subscribe(
+        self, user_id: int, chat_id: int, races: List[Race], minutes: List[int]
+    ) -> bool:
+        """Subscribe a user, returning whether old subscriptions were replaced."""
+        replaced = self.subscription_store.replace(user_id, chat_id, minutes)
+        self.schedule(races, minutes)
+        return replaced
+
+    def schedule(self, races: List[Race], minutes: Optional[List[int]] = None) -> None:
+        """
+        (Re)schedules the jobs of the races for the given minutes, by default all
+        the subscribed ones. Jobs already due are left alone.
+        """
+        scheduler = self.job_queue.scheduler
+        if not scheduler.running:
+            # Scheduled by start.
+            return
+        if minutes is None:
+            minutes = self.subscription_store.minutes()
+        now = datetime.datetime.now(scheduler.timezone)
+        jobs = []
+        for race in races:
+            for minute in set(minutes):
+                trigger = DateTrigger(
+                    run_date=race.start_timestamp - datetime.timedelta(minutes=minute),
+                    timezone=race.start_timestamp.tzinfo or scheduler.timezone,
+                )
+                next_run_time = trigger.get_next_fire_time(None, now)
+                if next_run_time is None or next_run_time <= now:
+                    continue
+                jobs.append(
+                    self._build_job(
+                        name=lineup_reminder_job_name(race.id, minute),
+                        trigger=trigger,
+                        next_run_time=next_run_time,
+                    )
+                )
+        if not jobs:
+            return
+        # Job ids are their names, so rescheduling replaces the old ones.
+        self.jobstore.replace_jobs(remove_ids=[job.id for job in jobs], jobs=jobs)
+        scheduler.wakeup()
+
+    def broadcast(self, context: CallbackContext) -> None:
+        name = context.job.name if context.job is not None else None
+        reminder = parse_lineup_reminder_job_name(name)
+        if reminder is None or reminder.minute is None:
+            self.logger.warning(f"Not a lineup reminder broadcast: {name}")
+            return
+        chat_ids = self.subscription_store.chat_ids(reminder.minute)
+        self.logger.info(f"Sending lineup reminder {name} to {len(chat_ids)} chats")
+        bot = cast(ScheduledBot, context.bot)
+        for chat_id in chat_ids:
+            bot.enqueue_message(
+                chat_id, LINEUP_REMINDER_TEXT, priority=BULK
+            ).add_done_callback(functools.partial(self._reminded, chat_id))
+
+    def _reminded(self, chat_id: int, message: "Future[Message]") -> None:
+        # Called by the outbound scheduler, which logs the other errors.
+        if isinstance(message.exception(), Unauthorized):
+            self.logger.info(f"Chat {chat_id} blocked the bot, unsubscribing it")
+            self.subscription_store.remove_chat(chat_id)
+
+    def _migrate_user_reminders(self, races: List[Race]) -> None:
+        # Reminders used to be a job per user, race and minute, the minute
+        # missing from the oldest names.
+        rows = self.jobstore.get_user_lineup_reminder_rows()
+        if not rows:
+            return
+        starts = {race.id: race.start_timestamp for race in races}
+        subscriptions: Dict[int, Dict[int, int]] = {}
+        migrated = []
+        for row in rows:
+            reminder = parse_lineup_reminder_job_name(row.name)
+            if reminder is None:
+                self.logger.warning(f"Not migrating job {row.id} named {row.name}")
+                continue
+            migrated.append(row.id)
+            minute = reminder.minute
+            if (
+                minute is None
+                and row.race_id in starts
+                and row.next_run_time is not None
+            ):
+                run_date = utc_timestamp_to_datetime(row.next_run_time)
+                minute = round((starts[row.race_id] - run_date).total_seconds() / 60)
+            if minute and row.chat_id is not None:
+                subscriptions.setdefault(row.user_id, {})[minute] = row.chat_id
+        self.subscription_store.add(subscriptions)
+        self.jobstore.replace_jobs(remove_ids=migrated, jobs=[])
+        self.logger.info(
+            f"Migrated {len(migrated)} lineup reminder jobs "
+            f"to {len(subscriptions)} subscriptions"
+        )
+
+    def _build_job(
+        self, name: str, trigger: DateTrigger, next_run_time: datetime.datetime
+    ) -> APSJob:
+        # The same job JobQueue.run_once would add, built without adding it.
+        scheduler = self.job_queue.scheduler
+        tg_job = Job(send_lineup_reminders, name=name, job_queue=self.job_queue)
+        job = APSJob(
+            scheduler,
+            id=name,
+            func=send_lineup_reminders,
+            trigger=trigger,
+            executor="default",
+            args=(CallbackContext.from_job(tg_job, self.jobstore.dispatcher),),
+            kwargs={},
+            name=name,
+            misfire_grace_time=scheduler._job_defaults["misfire_grace_time"],
+            coalesce=scheduler._job_defaults["coalesce"],
+            max_instances=scheduler._job_defaults["max_instances"],
+            next_run_time=next_run_time,
+        )
+        tg_job.job = job
+        return job
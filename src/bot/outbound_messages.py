@@ -0,0 +1,398 @@
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from metrics import (
+    OUTBOUND_DELIVERY_DURATION,
+    OUTBOUND_MERGED_MESSAGES,
+    OUTBOUND_RETRIES,
+)
+
+from telegram import Message
+from telegram.constants import MAX_MESSAGE_LENGTH
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+
+# Replies to commands go before anything else, like the lineup reminders.
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Telegram allows about 30 messages per second overall, one per second to a
+# chat with short bursts tolerated and 20 per minute to a group.
+MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_SECOND = 1
+GROUP_MESSAGES_PER_SECOND = 20 / 60
+CHAT_BURST = 3
+MAX_ATTEMPTS = 5
+MERGED_TEXT_SEPARATOR = "\n\n"
+# How often the buckets of the chats no longer messaged are dropped.
+PRUNE_INTERVAL = 60
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if it is already."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class OutboundMessage:
+    def __init__(
+        self,
+        send: Callable[..., Any],
+        method: str,
+        chat_key: Hashable,
+        kwargs: Dict[str, Any],
+        priority: int,
+    ):
+        self.send = send
+        self.method = method
+        self.chat_key = chat_key
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+
+    def merges(self, message: "OutboundMessage", text_length: int) -> bool:
+        """Whether the message, queued right after, can be sent along this one."""
+        if self.method != message.method:
+            return False
+        if self.method == "edit_message_text":
+            # Only the last text of the same message is worth sending.
+            return all(
+                self.kwargs.get(key) == message.kwargs.get(key)
+                for key in ("chat_id", "message_id", "inline_message_id")
+            )
+        return (
+            self.method == "send_message"
+            and _without_text(self.kwargs) == _without_text(message.kwargs)
+            and self.kwargs.get("reply_markup") is None
+            and self.kwargs.get("entities") is None
+            and text_length + len(MERGED_TEXT_SEPARATOR) + len(message.kwargs["text"])
+            <= MAX_MESSAGE_LENGTH
+        )
+
+
+def _without_text(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in kwargs.items() if key != "text"}
+
+
+class OutboundMessageScheduler:
+    """
+    The one queue of the messages sent to Telegram, delivered by `senders`
+    threads within Telegram's limits: a token bucket for all the messages, one
+    for each chat and one for the bulk ones, so that broadcasts leave room for
+    the replies. Messages to a chat are sent in order, one at a time, and the
+    ones queued meanwhile are merged into a single message when possible. A
+    retry_after response pauses the chat and queues the message again.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        senders: int = 4,
+        messages_per_second: float = MESSAGES_PER_SECOND,
+        bulk_messages_per_second: float = 25,
+    ):
+        now = time.monotonic()
+        self.logger = logger
+        self.senders = senders
+        self.bucket = TokenBucket(messages_per_second, messages_per_second, now)
+        self.bulk_bucket = TokenBucket(
+            bulk_messages_per_second, bulk_messages_per_second, now
+        )
+        self.chat_buckets: Dict[Hashable, TokenBucket] = {}
+        self.paused_until: Dict[Hashable, float] = {}
+        self.pending: Dict[int, "OrderedDict[Hashable, Deque[OutboundMessage]]"] = {
+            priority: OrderedDict() for priority in sorted(PRIORITY_NAMES)
+        }
+        self.depths = {priority: 0 for priority in PRIORITY_NAMES}
+        self.in_flight: Set[Hashable] = set()
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.pruned_at = now
+        self.threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.senders):
+            thread = threading.Thread(
+                target=self._run, name=f"outbound-sender-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> None:
+        """Stops once the queued messages are sent."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def depth(self, priority: int) -> int:
+        return self.depths[priority]
+
+    def submit(
+        self,
+        send: Callable[..., Any],
+        method: str,
+        chat_key: Hashable,
+        kwargs: Dict[str, Any],
+        priority: int = INTERACTIVE,
+    ) -> Future:
+        """Queues send(**kwargs), the future resolving to what it returns."""
+        message = OutboundMessage(send, method, chat_key, kwargs, priority)
+        with self.condition:
+            self.pending[priority].setdefault(chat_key, deque()).append(message)
+            self.depths[priority] += 1
+            self.condition.notify()
+        return message.future
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                batch, wait = self._take()
+                while batch is None:
+                    if self.stopping and not any(self.depths.values()):
+                        return
+                    self.condition.wait(wait)
+                    batch, wait = self._take()
+            self._send(batch)
+
+    def _take(self) -> Tuple[Optional[List[OutboundMessage]], Optional[float]]:
+        """
+        The next messages to send, merged into one, or None and how long to
+        wait for a token: None if only for a chat to be done sending.
+        """
+        if not any(self.depths.values()):
+            return None, None
+        now = time.monotonic()
+        if now - self.pruned_at > PRUNE_INTERVAL:
+            self._prune(now)
+        wait: Optional[float] = self.bucket.wait_time(now)
+        if wait:
+            return None, wait
+        wait = None
+        for priority, chats in self.pending.items():
+            if not chats:
+                continue
+            if priority == BULK:
+                bulk_wait = self.bulk_bucket.wait_time(now)
+                if bulk_wait:
+                    wait = _earliest(wait, bulk_wait)
+                    continue
+            for chat_key, messages in chats.items():
+                if chat_key in self.in_flight:
+                    continue
+                chat_wait = max(
+                    self._chat_bucket(chat_key, now).wait_time(now),
+                    self.paused_until.get(chat_key, now) - now,
+                )
+                if chat_wait > 0:
+                    wait = _earliest(wait, chat_wait)
+                    continue
+                batch = self._merge(messages)
+                if messages:
+                    # The chats take turns.
+                    chats.move_to_end(chat_key)
+                else:
+                    del chats[chat_key]
+                self.depths[priority] -= len(batch)
+                self.in_flight.add(chat_key)
+                self.bucket.take(now)
+                self.chat_buckets[chat_key].take(now)
+                if priority == BULK:
+                    self.bulk_bucket.take(now)
+                return batch, None
+        return None, wait
+
+    def _merge(self, messages: Deque[OutboundMessage]) -> List[OutboundMessage]:
+        batch = [messages.popleft()]
+        text_length = len(batch[0].kwargs.get("text", ""))
+        while messages and batch[0].merges(messages[0], text_length):
+            batch.append(messages.popleft())
+            text_length += len(MERGED_TEXT_SEPARATOR) + len(batch[-1].kwargs["text"])
+        if len(batch) > 1:
+            OUTBOUND_MERGED_MESSAGES.inc(len(batch) - 1)
+        return batch
+
+    def _send(self, batch: List[OutboundMessage]) -> None:
+        first = batch[0]
+        kwargs = dict(batch[-1].kwargs)
+        if first.method == "send_message":
+            kwargs["text"] = MERGED_TEXT_SEPARATOR.join(
+                message.kwargs["text"] for message in batch
+            )
+        try:
+            result = first.send(**kwargs)
+        except RetryAfter as e:
+            self._retry(batch, e.retry_after)
+            return
+        except Exception as e:
+            self.logger.warning(f"Unable to {first.method} to {first.chat_key}: {e}")
+            self._done(first.chat_key)
+            for message in batch:
+                message.future.set_exception(e)
+            return
+        self._done(first.chat_key)
+        delivered_at = time.monotonic()
+        histogram = OUTBOUND_DELIVERY_DURATION.labels(
+            priority=PRIORITY_NAMES[first.priority]
+        )
+        for message in batch:
+            histogram.observe(delivered_at - message.queued_at)
+            message.future.set_result(result)
+
+    def _retry(self, batch: List[OutboundMessage], retry_after: float) -> None:
+        first = batch[0]
+        OUTBOUND_RETRIES.inc()
+        first.attempts += 1
+        if first.attempts >= MAX_ATTEMPTS:
+            self.logger.warning(
+                f"Unable to {first.method} to {first.chat_key}: flood limit"
+            )
+            self._done(first.chat_key)
+            error = RetryAfter(int(retry_after))
+            for message in batch:
+                message.future.set_exception(error)
+            return
+        self.logger.warning(
+            f"Flood limit reached for {first.chat_key}, waiting {retry_after}s"
+        )
+        with self.condition:
+            self.paused_until[first.chat_key] = time.monotonic() + retry_after
+            chats = self.pending[first.priority]
+            # Merged again when taken, possibly with the ones queued meanwhile.
+            chats.setdefault(first.chat_key, deque()).extendleft(reversed(batch))
+            chats.move_to_end(first.chat_key, last=False)
+            self.depths[first.priority] += len(batch)
+            self.in_flight.discard(first.chat_key)
+            self.condition.notify_all()
+
+    def _done(self, chat_key: Hashable) -> None:
+        with self.condition:
+            self.in_flight.discard(chat_key)
+            self.condition.notify_all()
+
+    def _chat_bucket(self, chat_key: Hashable, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_key)
+        if bucket is None:
+            # Groups and channels have negative ids, or are given by username.
+            rate = (
+                CHAT_MESSAGES_PER_SECOND
+                if isinstance(chat_key, int) and chat_key > 0
+                else GROUP_MESSAGES_PER_SECOND
+            )
+            bucket = self.chat_buckets[chat_key] = TokenBucket(rate, CHAT_BURST, now)
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        self.pruned_at = now
+        self.chat_buckets = {
+            chat_key: bucket
+            for chat_key, bucket in self.chat_buckets.items()
+            if chat_key in self.in_flight or not bucket.is_full(now)
+        }
+        self.paused_until = {
+            chat_key: until
+            for chat_key, until in self.paused_until.items()
+            if until > now
+        }
+
+
+def _earliest(wait: Optional[float], other: float) -> float:
+    return other if wait is None else min(wait, other)
+
+
+SEND_MESSAGE = inspect.signature(ExtBot.send_message)
+EDIT_MESSAGE_TEXT = inspect.signature(ExtBot.edit_message_text)
+
+
+class ScheduledBot(ExtBot):
+    """
+    A bot whose send_message and edit_message_text go through the outbound
+    scheduler, waiting for the message to be sent. enqueue_message sends
+    without waiting, returning a future of the message.
+    """
+
+    def __init__(self, token: str, scheduler: OutboundMessageScheduler, **kwargs):
+        super().__init__(token, **kwargs)
+        self.scheduler = scheduler
+
+    def send_message(self, *args, priority: int = INTERACTIVE, **kwargs) -> Message:
+        return self._send_message(args, kwargs, priority).result()
+
+    def edit_message_text(
+        self, *args, priority: int = INTERACTIVE, **kwargs
+    ) -> Union[Message, bool]:
+        arguments = _arguments(EDIT_MESSAGE_TEXT, self, args, kwargs)
+        return self.scheduler.submit(
+            super().edit_message_text,
+            "edit_message_text",
+            arguments.get("chat_id") or arguments.get("inline_message_id"),
+            arguments,
+            priority,
+        ).result()
+
+    def enqueue_message(
+        self, chat_id: Union[int, str], text: str, priority: int = INTERACTIVE, **kwargs
+    ) -> "Future[Message]":
+        """Queues a send_message, without waiting for it to be sent."""
+        return self._send_message((chat_id, text), kwargs, priority)
+
+    def _send_message(
+        self, args: tuple, kwargs: dict, priority: int
+    ) -> "Future[Message]":
+        arguments = _arguments(SEND_MESSAGE, self, args, kwargs)
+        return self.scheduler.submit(
+            super().send_message,
+            "send_message",
+            arguments["chat_id"],
+            arguments,
+            priority,
+        )
+
+
+def _arguments(
+    signature: inspect.Signature, bot: ExtBot, args: tuple, kwargs: dict
+) -> dict:
+    # By name, for messages to be compared and merged.
+    arguments = signature.bind(bot, *args, **kwargs).arguments
+    del arguments["self"]
+    return dict(arguments)
@@ -1,31 +1,109 @@
+import json
 import logging
+from threading import Thread
+from typing import Callable, Optional
 
 from adapters.persistence.jobstore import PTBSQLAlchemyJobStore
-from core.configuration import DatabaseConfig
+from bot.lineup_reminders import send_lineup_reminders
+from bot.outbound_messages import OutboundMessageScheduler, ScheduledBot
+from core.configuration import DatabaseConfig, database_url
 
-from telegram.ext import Updater
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Dispatcher, Updater
+from telegram.utils.request import Request
 
 logger = logging.getLogger(name=__name__)
 logger.setLevel(level="DEBUG")
 
 
+def webhook_handler(dispatcher: Dispatcher) -> Callable[[bytes], None]:
+    """
+    Decodes the body of a webhook request, an update or a list of them, and
+    queues the updates to the dispatcher as polling would.
+    """
+
+    def handle(body: bytes) -> None:
+        payload = json.loads(body)
+        for data in payload if isinstance(payload, list) else [payload]:
+            if not isinstance(data, dict):
+                raise ValueError("Not an update")
+            try:
+                update = Update.de_json(data, dispatcher.bot)
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Invalid update: {e}") from e
+            if update is not None:
+                dispatcher.update_queue.put(update)
+
+    return handle
+
+
 class Bot:
-    def __init__(self, api_key: str, db_config: DatabaseConfig):
+    def __init__(
+        self,
+        api_key: str,
+        db_config: DatabaseConfig,
+        outbound_scheduler: OutboundMessageScheduler,
+        con_pool_size: int = 8,
+    ):
         try:
-            self.application = Updater(token=api_key)
-            self.dispatcher = self.application.dispatcher
-            self.dispatcher.job_queue.scheduler.add_jobstore(
-                PTBSQLAlchemyJobStore(
-                    dispatcher=self.dispatcher,
-                    url=f"postgresql://{db_config.username}:{db_config.password}@{db_config.hostname}:{db_config.port}/{db_config.db_name}",  # noqa: E501
+            # Messages are sent through the outbound scheduler. Connections to
+            # the Bot API are shared by every thread calling it.
+            self.application = Updater(
+                bot=ScheduledBot(
+                    token=api_key,
+                    scheduler=outbound_scheduler,
+                    request=Request(con_pool_size=con_pool_size),
                 )
             )
+            self.dispatcher = self.application.dispatcher
+            self.jobstore = PTBSQLAlchemyJobStore(
+                dispatcher=self.dispatcher,
+                lineup_reminder_callback=send_lineup_reminders,
+                url=database_url(db_config),
+            )
+            self.dispatcher.job_queue.scheduler.add_jobstore(self.jobstore)
         except Exception as e:
             logger.error(e)
 
-    def start_bot(self):
+    def start_bot(
+        self,
+        webhook_url: Optional[str] = None,
+        secret_token: Optional[str] = None,
+        max_connections: int = 40,
+    ):
+        """
+        Receives updates through the webhook if given, whose requests are served
+        by the HTTP server, otherwise or if it can't be set by polling.
+        """
         try:
-            self.application.start_polling()
+            if not webhook_url or not self._start_webhook(
+                webhook_url, secret_token, max_connections
+            ):
+                self.application.start_polling()
             self.application.idle()
         except Exception as e:
             logger.error(e)
+
+    def _start_webhook(
+        self, webhook_url: str, secret_token: Optional[str], max_connections: int
+    ) -> bool:
+        try:
+            # Telegram sends an update per request and waits for the response
+            # before sending the next on the connection: bursts are delivered
+            # max_connections at a time.
+            self.application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                max_connections=max_connections,
+            )
+        except TelegramError as e:
+            logger.error(f"Unable to set the webhook, falling back to polling: {e}")
+            return False
+        logger.info(f"Receiving updates through {webhook_url}")
+        # What Updater.start_webhook does, without its own HTTP server.
+        self.dispatcher.job_queue.start()
+        Thread(target=self.dispatcher.start, name="dispatcher", daemon=True).start()
+        # Lets idle stop the job queue and the dispatcher on exit.
+        self.application.running = True
+        return True
@@ -3,7 +3,9 @@ TELEGRAM_START_COMMAND = "start"
 TELEGRAM_FANTASY_LAST_GP_STANDING_COMMAND = "last_gp_standing"
 TELEGRAM_FANTASY_STANDING_COMMAND = "standing"
 TELEGRAM_FANTASY_TEAM_COMMAND = "last_gp_team_result"
+TELEGRAM_FANTASY_LEAGUE_LINEUPS_COMMAND = "last_gp_lineups"
 TELEGRAM_FANTASY_LINEUP_REMINDER = "lineup_reminder"
+TELEGRAM_FANTASY_TREND_COMMAND = "trend"
 
 
 class TelegramCommand:
@@ -33,6 +35,15 @@ COMMANDS = [
         name=TELEGRAM_FANTASY_TEAM_COMMAND,
         description="Get F1 Fantasy league standing for single team",
     ),
+    TelegramCommand(
+        name=TELEGRAM_FANTASY_LEAGUE_LINEUPS_COMMAND,
+        description="Get the lineups of every league team for the last GP",
+    ),
+    TelegramCommand(
+        name=TELEGRAM_FANTASY_TREND_COMMAND,
+        description=f"Get the season trend of the league, or of a single team."
+        f"\n/{TELEGRAM_FANTASY_TREND_COMMAND} [username]",
+    ),
     TelegramCommand(
         name=TELEGRAM_FANTASY_LINEUP_REMINDER,
         description=f"Remind me to make the lineup. You can set the minutes "
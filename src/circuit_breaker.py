@@ -0,0 +1,90 @@
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque
+
+
+class CircuitState(Enum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitBreaker:
+    """
+    Fails the requests to an upstream fast while it is failing. The circuit
+    opens once failure_rate of the last `window` requests failed, counting from
+    min_requests of them, and rejects requests for open_seconds. Then it lets
+    half_open_probes requests through: it closes if they succeed and opens
+    again as soon as one fails.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_requests: int = 10,
+        open_seconds: float = 30,
+        half_open_probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.clock = clock
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a request can be sent, to be followed by record or abandon."""
+        if self.state is CircuitState.OPEN:
+            if self.clock() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = CircuitState.HALF_OPEN
+            self.probes = 0
+            self.probe_successes = 0
+        if self.state is CircuitState.HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes += 1
+        return True
+
+    def record(self, success: bool) -> None:
+        if self.state is CircuitState.HALF_OPEN:
+            if not success:
+                self._open()
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.half_open_probes:
+                self.state = CircuitState.CLOSED
+                self.outcomes.clear()
+            return
+        if self.state is CircuitState.OPEN:
+            # Sent before the circuit opened.
+            return
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if len(
+            self.outcomes
+        ) >= self.min_requests and failures >= self.failure_rate * len(self.outcomes):
+            self._open()
+
+    def abandon(self) -> None:
+        """For a request allowed but cancelled before its outcome was known."""
+        if self.state is CircuitState.HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def stats(self) -> dict:
+        return {"state": self.state.value, "rejected": self.rejected}
+
+    def _open(self) -> None:
+        self.state = CircuitState.OPEN
+        self.opened_at = self.clock()
+        self.outcomes.clear()
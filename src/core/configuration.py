@@ -21,14 +21,42 @@ class DatabaseConfig:
         self.db_name = db_name
 
 
+def database_url(db_config: DatabaseConfig) -> str:
+    return f"postgresql://{db_config.username}:{db_config.password}@{db_config.hostname}:{db_config.port}/{db_config.db_name}"  # noqa: E501
+
+
+class SessionConfig:
+    def __init__(self, encryption_key: Optional[str]):
+        self.encryption_key = encryption_key
+
+
 class LogConfig:
     def __init__(self, log_level: str):
         self.log_level = log_level
 
 
 class BotConfig:
-    def __init__(self, api_key: Optional[str]):
+    def __init__(
+        self,
+        api_key: Optional[str],
+        broadcast_messages_per_second: float,
+        webhook_url: Optional[str] = None,
+        webhook_secret_token: Optional[str] = None,
+        webhook_max_connections: int = 40,
+        handler_workers: int = 8,
+        handler_queue_size: int = 64,
+        outbound_senders: int = 4,
+        outbound_messages_per_second: float = 30,
+    ):
         self.api_key = api_key
+        self.broadcast_messages_per_second = broadcast_messages_per_second
+        self.webhook_url = webhook_url
+        self.webhook_secret_token = webhook_secret_token
+        self.webhook_max_connections = webhook_max_connections
+        self.handler_workers = handler_workers
+        self.handler_queue_size = handler_queue_size
+        self.outbound_senders = outbound_senders
+        self.outbound_messages_per_second = outbound_messages_per_second
 
 
 class F1FantasyConfig:
@@ -37,16 +65,69 @@ class F1FantasyConfig:
         credentials: Credentials,
         login_url: Optional[str],
         league_id: Optional[str],
+        fan_out_concurrency: int,
+        drivers_refresh_interval: float,
+        leaderboard_page_size: int,
+        leaderboard_prefetch_window: int,
     ):
         self.credentials = credentials
         self.login_url = login_url
         self.league_id = league_id
+        self.fan_out_concurrency = fan_out_concurrency
+        self.drivers_refresh_interval = drivers_refresh_interval
+        self.leaderboard_page_size = leaderboard_page_size
+        self.leaderboard_prefetch_window = leaderboard_prefetch_window
+
+
+class HttpClientConfig:
+    def __init__(
+        self,
+        pool_size: int,
+        connect_timeout: float,
+        read_timeout: float,
+        max_retries: int,
+        backoff_factor: float,
+        circuit_failure_rate: float = 0.5,
+        circuit_window: int = 20,
+        circuit_min_requests: int = 10,
+        circuit_open_seconds: float = 30,
+        hedge_percentile: Optional[float] = 95,
+    ):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.circuit_failure_rate = circuit_failure_rate
+        self.circuit_window = circuit_window
+        self.circuit_min_requests = circuit_min_requests
+        self.circuit_open_seconds = circuit_open_seconds
+        self.hedge_percentile = hedge_percentile
+
+
+class CacheConfig:
+    def __init__(
+        self,
+        schedule_ttl: float,
+        leaderboard_max_entries: int,
+        leaderboard_live_ttl: float,
+        render_max_entries: int,
+        stale_timeout: float = 2,
+    ):
+        self.schedule_ttl = schedule_ttl
+        self.leaderboard_max_entries = leaderboard_max_entries
+        self.leaderboard_live_ttl = leaderboard_live_ttl
+        self.render_max_entries = render_max_entries
+        self.stale_timeout = stale_timeout
 
 
 class HttpServerConfig:
-    def __init__(self, hostname: str, port: int) -> None:
+    def __init__(
+        self, hostname: str, port: int, admin_token: Optional[str] = None
+    ) -> None:
         self.hostname = hostname
         self.port = port
+        self.admin_token = admin_token
 
 
 class Configuration:
@@ -61,12 +142,99 @@ class Configuration:
                 default="https://account.formula1.com/#/en/login",  # noqa: E501
             ),
             league_id=env_variables.get("F1_FANTASY_LEAGUE_ID"),
+            fan_out_concurrency=int(
+                env_variables.get("F1_FANTASY_FAN_OUT_CONCURRENCY", default=5)
+            ),
+            drivers_refresh_interval=float(
+                env_variables.get(
+                    "F1_FANTASY_DRIVERS_REFRESH_INTERVAL_MINUTES", default=60
+                )
+            ),
+            leaderboard_page_size=int(
+                env_variables.get("F1_FANTASY_LEADERBOARD_PAGE_SIZE", default=100)
+            ),
+            leaderboard_prefetch_window=int(
+                env_variables.get("F1_FANTASY_LEADERBOARD_PREFETCH_WINDOW", default=3)
+            ),
+        )
+        self.http_client = HttpClientConfig(
+            pool_size=int(env_variables.get("HTTP_CLIENT_POOL_SIZE", default=10)),
+            connect_timeout=float(
+                env_variables.get("HTTP_CLIENT_CONNECT_TIMEOUT", default=3.05)
+            ),
+            read_timeout=float(
+                env_variables.get("HTTP_CLIENT_READ_TIMEOUT", default=10)
+            ),
+            max_retries=int(env_variables.get("HTTP_CLIENT_MAX_RETRIES", default=3)),
+            backoff_factor=float(
+                env_variables.get("HTTP_CLIENT_BACKOFF_FACTOR", default=0.3)
+            ),
+            circuit_failure_rate=float(
+                env_variables.get("HTTP_CLIENT_CIRCUIT_FAILURE_RATE", default=0.5)
+            ),
+            circuit_window=int(
+                env_variables.get("HTTP_CLIENT_CIRCUIT_WINDOW", default=20)
+            ),
+            circuit_min_requests=int(
+                env_variables.get("HTTP_CLIENT_CIRCUIT_MIN_REQUESTS", default=10)
+            ),
+            circuit_open_seconds=float(
+                env_variables.get("HTTP_CLIENT_CIRCUIT_OPEN_SECONDS", default=30)
+            ),
+            # 0 sends no hedged requests.
+            hedge_percentile=float(
+                env_variables.get("HTTP_CLIENT_HEDGE_PERCENTILE", default=95)
+            )
+            or None,
+        )
+        self.cache = CacheConfig(
+            schedule_ttl=float(
+                env_variables.get("SCHEDULE_CACHE_TTL_SECONDS", default=3600)
+            ),
+            leaderboard_max_entries=int(
+                env_variables.get("LEADERBOARD_CACHE_MAX_ENTRIES", default=256)
+            ),
+            leaderboard_live_ttl=float(
+                env_variables.get("LEADERBOARD_CACHE_LIVE_TTL_SECONDS", default=60)
+            ),
+            render_max_entries=int(
+                env_variables.get("RENDER_CACHE_MAX_ENTRIES", default=128)
+            ),
+            stale_timeout=float(
+                env_variables.get("STALE_RESPONSE_TIMEOUT_SECONDS", default=2)
+            ),
+        )
+        self.session = SessionConfig(
+            encryption_key=env_variables.get("SESSION_ENCRYPTION_KEY"),
+        )
+        self.bot = BotConfig(
+            api_key=env_variables.get("TELEGRAM_BOT_API_KEY"),
+            broadcast_messages_per_second=float(
+                env_variables.get("TELEGRAM_BROADCAST_MESSAGES_PER_SECOND", default=25)
+            ),
+            webhook_url=env_variables.get("TELEGRAM_WEBHOOK_URL"),
+            webhook_secret_token=env_variables.get("TELEGRAM_WEBHOOK_SECRET_TOKEN"),
+            webhook_max_connections=int(
+                env_variables.get("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", default=100)
+            ),
+            handler_workers=int(
+                env_variables.get("TELEGRAM_HANDLER_WORKERS", default=8)
+            ),
+            handler_queue_size=int(
+                env_variables.get("TELEGRAM_HANDLER_QUEUE_SIZE", default=64)
+            ),
+            outbound_senders=int(
+                env_variables.get("TELEGRAM_OUTBOUND_SENDERS", default=4)
+            ),
+            outbound_messages_per_second=float(
+                env_variables.get("TELEGRAM_OUTBOUND_MESSAGES_PER_SECOND", default=30)
+            ),
         )
-        self.bot = BotConfig(api_key=env_variables.get("TELEGRAM_BOT_API_KEY"))
         self.log = LogConfig(log_level=env_variables.get("LOG_LEVEL", default="DEBUG"))
         self.http_server = HttpServerConfig(
             hostname=env_variables.get("HTTP_SERVER_HOSTNAME", default="0.0.0.0"),
             port=int(env_variables.get("PORT", default=8080)),
+            admin_token=env_variables.get("HTTP_SERVER_ADMIN_TOKEN"),
         )
         self.db_config = DatabaseConfig(
             hostname=env_variables.get("DB_HOSTNAME"),
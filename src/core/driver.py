@@ -0,0 +1,15 @@
+class Driver:
+    __slots__ = ("player_id", "display_name", "team_name", "gameday_points")
+
+    def __init__(
+        self, player_id: int, display_name: str, team_name: str, gameday_points: int
+    ):
+        self.player_id = player_id
+        self.display_name = display_name
+        self.team_name = team_name
+        self.gameday_points = gameday_points
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Driver) and all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__
+        )
@@ -1,3 +1,7 @@
+from typing import Optional
+
+
 class Error:
-    def __init__(self, message: str):
+    def __init__(self, message: str, status_code: Optional[int] = None):
         self.message = message
+        self.status_code = status_code
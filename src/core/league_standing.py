@@ -1,8 +1,10 @@
-from typing import List
+from typing import List, Optional
 
 from core.leaderboard_entrants import LeaderboardEntrant
 
 
 class LeagueStanding:
-    def __init__(self, entrants: List[LeaderboardEntrant]):
+    def __init__(self, entrants: List[LeaderboardEntrant], age: Optional[float] = None):
         self.entrants = entrants
+        # Seconds since it was fetched, when served stale.
+        self.age = age
@@ -0,0 +1,46 @@
+import re
+from typing import Optional
+
+# A reminder more than a week ahead would be for the race before.
+MAX_LINEUP_REMINDER_MINUTES = 7 * 24 * 60
+
+JOB_NAME_PATTERN = re.compile(r"^lineup-reminder-(?P<race_id>\d+)-(?P<minute>\d+)$")
+# Reminders used to be one job per user, named without the minute at first,
+# then with it, possibly fractional.
+USER_JOB_NAME_PATTERN = re.compile(
+    r"^(?P<race_id>\d+)-(?P<user_id>\d+)(?:-(?P<minute>\d+(?:\.\d+)?))?$"
+)
+
+
+class LineupReminderKey:
+    def __init__(self, race_id: int, user_id: Optional[int], minute: Optional[int]):
+        self.race_id = race_id
+        self.user_id = user_id
+        self.minute = minute
+
+
+def lineup_reminder_job_name(race_id: int, minute: int) -> str:
+    return f"lineup-reminder-{race_id}-{minute}"
+
+
+def parse_lineup_reminder_job_name(name: Optional[str]) -> Optional[LineupReminderKey]:
+    """
+    Parses a reminder job name. The user is set only for the per-user reminders
+    scheduled before, and the minute may be missing for them.
+    """
+    match = JOB_NAME_PATTERN.match(name or "")
+    if match is not None:
+        return LineupReminderKey(
+            race_id=int(match.group("race_id")),
+            user_id=None,
+            minute=int(match.group("minute")),
+        )
+    match = USER_JOB_NAME_PATTERN.match(name or "")
+    if match is None:
+        return None
+    minute = match.group("minute")
+    return LineupReminderKey(
+        race_id=int(match.group("race_id")),
+        user_id=int(match.group("user_id")),
+        minute=int(float(minute)) if minute is not None else None,
+    )
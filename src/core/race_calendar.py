@@ -0,0 +1,58 @@
+import datetime
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+from core.race import Race, RaceStatus
+
+
+class RaceCalendar:
+    """Races of the season sorted by start time, with binary-search lookups."""
+
+    def __init__(self, races: List[Race]):
+        self.races = sorted(races, key=lambda race: race.start_timestamp)
+        self.start_timestamps = [race.start_timestamp for race in self.races]
+        self.completed_races = [
+            race for race in self.races if race.status is RaceStatus.COMPLETED
+        ]
+        self.completed_start_timestamps = [
+            race.start_timestamp for race in self.completed_races
+        ]
+
+    def last_completed(self, now: datetime.datetime) -> Optional[Race]:
+        i = bisect_left(self.completed_start_timestamps, now)
+        return self.completed_races[i - 1] if i > 0 else None
+
+    def next_upcoming(self, now: datetime.datetime) -> Optional[Race]:
+        i = bisect_right(self.start_timestamps, now)
+        return self.races[i] if i < len(self.races) else None
+
+    def races_after(self, t: datetime.datetime) -> List[Race]:
+        i = bisect_right(self.start_timestamps, t)
+        return self.races[i:]
+
+    def statuses(self) -> Dict[int, RaceStatus]:
+        return {race.id: race.status for race in self.races}
+
+    def next_transition(
+        self,
+        now: datetime.datetime,
+        completion_delay: datetime.timedelta,
+        retry_interval: datetime.timedelta,
+    ) -> Optional[datetime.datetime]:
+        """
+        When a race status is next expected to change: the start of the next race,
+        or the expected end of a race that started but is not completed yet.
+        Expected ends that have already passed are checked again after
+        retry_interval.
+        """
+        transitions = []
+        upcoming = self.next_upcoming(now)
+        if upcoming is not None:
+            transitions.append(upcoming.start_timestamp)
+        started = bisect_right(self.start_timestamps, now)
+        for race in self.races[:started]:
+            if race.status is not RaceStatus.COMPLETED:
+                transitions.append(
+                    max(race.start_timestamp + completion_delay, now + retry_interval)
+                )
+        return min(transitions) if transitions else None
@@ -0,0 +1,8 @@
+import datetime
+from typing import Optional
+
+
+class Session:
+    def __init__(self, cookie: str, expires_at: Optional[datetime.datetime]):
+        self.cookie = cookie
+        self.expires_at = expires_at
@@ -0,0 +1,153 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from core.leaderboard_entrants import LeaderboardEntrant
+from core.race import Race
+
+FORM_WINDOW = 3
+
+
+def competition_ranks(values: np.ndarray) -> np.ndarray:
+    """Rank every column in descending order, ties sharing the best rank (1224)."""
+    order = np.argsort(-values, axis=0, kind="stable")
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    rows = np.arange(values.shape[0], dtype=np.int32)[:, None]
+    is_new = np.ones(values.shape, dtype=bool)
+    is_new[1:] = sorted_values[1:] != sorted_values[:-1]
+    first_of_tie = np.maximum.accumulate(np.where(is_new, rows, 0), axis=0)
+    ranks = np.empty(values.shape, dtype=np.int32)
+    np.put_along_axis(ranks, order, first_of_tie + 1, axis=0)
+    return ranks
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of the last `window` columns up to each column, fewer at the start."""
+    sums = np.zeros((values.shape[0], values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(values, axis=1, out=sums[:, 1:])
+    ends = np.arange(1, values.shape[1] + 1)
+    starts = np.maximum(ends - window, 0)
+    return ((sums[:, ends] - sums[:, starts]) / (ends - starts)).astype(np.float32)
+
+
+class StandingsHistory:
+    """
+    Points scored by every league entrant in every completed race, one row per
+    entrant and one column per race. Totals, ranks, form and gaps are computed
+    for the whole league at once when a race is added, so reads are array
+    lookups. Instances are never modified: with_race returns a new history.
+    """
+
+    def __init__(
+        self,
+        races: Sequence[Race],
+        user_ids: Sequence[str],
+        usernames: Sequence[str],
+        points: np.ndarray,
+        form_window: int = FORM_WINDOW,
+    ):
+        self.races = list(races)
+        self.user_ids = list(user_ids)
+        self.usernames = list(usernames)
+        self.points = points
+        self.form_window = form_window
+        self.race_index = {race.id: i for i, race in enumerate(self.races)}
+        self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.username_index = {
+            username.lower(): i for i, username in enumerate(self.usernames)
+        }
+
+        self.totals = np.cumsum(points, axis=1, dtype=np.float32)
+        self.race_ranks = competition_ranks(points)
+        self.positions = competition_ranks(self.totals)
+        self.gaps = (
+            self.totals.max(axis=0, initial=0) - self.totals
+            if len(self.user_ids)
+            else np.zeros_like(self.totals)
+        )
+        self.form = rolling_mean(points, window=form_window)
+        # Rows sorted by current position, for top-N reads.
+        self.leaderboard = (
+            np.argsort(self.positions[:, -1], kind="stable")
+            if self.races
+            else np.arange(len(self.user_ids))
+        )
+
+    @classmethod
+    def empty(cls, form_window: int = FORM_WINDOW) -> "StandingsHistory":
+        return cls(
+            races=[],
+            user_ids=[],
+            usernames=[],
+            points=np.zeros((0, 0), dtype=np.float32),
+            form_window=form_window,
+        )
+
+    def has_race(self, race_id: int) -> bool:
+        return race_id in self.race_index
+
+    def with_race(
+        self, race: Race, entrants: Iterable[LeaderboardEntrant]
+    ) -> "StandingsHistory":
+        """
+        Adds the points of a race. Entrants seen for the first time get 0 points
+        in the previous races, and entrants missing from the race get 0 in it.
+        """
+        user_index = dict(self.user_index)
+        user_ids = list(self.user_ids)
+        usernames = list(self.usernames)
+        rows: List[int] = []
+        scores: List[float] = []
+        for entrant in entrants:
+            row = user_index.get(entrant.user.user_id)
+            if row is None:
+                row = user_index[entrant.user.user_id] = len(user_ids)
+                user_ids.append(entrant.user.user_id)
+                usernames.append(entrant.user.username)
+            else:
+                usernames[row] = entrant.user.username
+            rows.append(row)
+            scores.append(float(entrant.score))
+
+        points = np.zeros((len(user_ids), len(self.races) + 1), dtype=np.float32)
+        points[: len(self.user_ids), :-1] = self.points
+        points[rows, -1] = scores
+        return StandingsHistory(
+            races=self.races + [race],
+            user_ids=user_ids,
+            usernames=usernames,
+            points=points,
+            form_window=self.form_window,
+        )
+
+    def find(self, username_or_id: str) -> Optional[int]:
+        """Row of an entrant, looked up by user id or case-insensitive username."""
+        row = self.user_index.get(username_or_id)
+        if row is None:
+            row = self.username_index.get(username_or_id.lower())
+        return row
+
+    def leaders(self, limit: int) -> np.ndarray:
+        return self.leaderboard[:limit]
+
+    def position_changes(self) -> np.ndarray:
+        """Positions gained in the last race, per row."""
+        if len(self.races) < 2:
+            return np.zeros(len(self.user_ids), dtype=np.int32)
+        return self.positions[:, -2] - self.positions[:, -1]
+
+    def stats(self) -> Dict[str, int]:
+        arrays = [
+            self.points,
+            self.totals,
+            self.race_ranks,
+            self.positions,
+            self.gaps,
+            self.form,
+            self.leaderboard,
+        ]
+        return {
+            "races": len(self.races),
+            "entrants": len(self.user_ids),
+            "bytes": sum(array.nbytes for array in arrays),
+        }
@@ -0,0 +1,33 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class EventLoopThread:
+    """Runs an asyncio event loop on a daemon thread so blocking code can use it."""
+
+    def __init__(self, name: str = "asyncio-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def submit(self, coroutine: Coroutine[None, None, T]) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(
+        self, coroutine: Coroutine[None, None, T], timeout: Optional[float] = None
+    ) -> T:
+        return self.submit(coroutine).result(timeout=timeout)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -1,35 +1,354 @@
+import asyncio
+import functools
+import json
+import time
+from collections import deque
+from contextvars import ContextVar
 from enum import Enum
-from typing import Callable, Optional, TypeVar, Union
+from typing import (
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Generic,
+    Mapping,
+    Optional,
+    TypeVar,
+    Union,
+)
 
-import requests
+import aiohttp
 
+from circuit_breaker import CircuitBreaker
 from core.error import Error
+from metrics import UPSTREAM_HEDGED_REQUESTS
 
 T = TypeVar("T")
 
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+CIRCUIT_OPEN_MESSAGE = "Upstream unavailable, circuit open"
+# Of an error body that isn't JSON, like an HTML error page.
+MAX_ERROR_MESSAGE_LENGTH = 200
+DEADLINE_EXCEEDED_MESSAGE = "Deadline exceeded"
+# Latencies kept per hedge key, and how many are needed before hedging.
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+# When the requests of the running task must be answered by, on the
+# time.monotonic clock: set with within_deadline.
+DEADLINE: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+async def within_deadline(seconds: float, request: Awaitable[T]) -> T:
+    """Awaits the request, whose HTTP requests must all be done in `seconds`."""
+    token = DEADLINE.set(time.monotonic() + seconds)
+    try:
+        return await request
+    finally:
+        DEADLINE.reset(token)
+
 
 class HTTPMethod(Enum):
     GET = "GET"
     POST = "POST"
 
 
-class HTTPClient:
-    def __init__(self, base_url: str):
+class CacheValidators:
+    def __init__(self, etag: Optional[str], last_modified: Optional[str]):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def to_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ConditionalResponse(Generic[T]):
+    def __init__(
+        self,
+        value: Optional[T],
+        validators: Optional[CacheValidators],
+        not_modified: bool,
+    ):
+        self.value = value
+        self.validators = validators
+        self.not_modified = not_modified
+
+
+class HTTPResponse:
+    def __init__(self, status_code: int, headers: Mapping[str, str], body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def error(self) -> Error:
+        try:
+            message = self.json()
+        except ValueError:
+            message = self.body[:MAX_ERROR_MESSAGE_LENGTH].decode(
+                "utf-8", errors="replace"
+            )
+        return Error(message, status_code=self.status_code)
+
+    def decode(self, decoder: Callable[[dict], T]) -> Union[Error, T]:
+        try:
+            return decoder(self.json())
+        except (ValueError, KeyError, TypeError) as e:
+            # Not JSON, like an HTML error page, or not the expected one.
+            return Error(f"Invalid response: {e!r}", status_code=self.status_code)
+
+
+class AsyncHTTPClient:
+    """
+    Asyncio HTTP client sharing one pool of keep-alive connections between all
+    the in-flight requests. The session is created lazily, on the event loop
+    that performs the first request. With a circuit breaker, requests fail
+    fast while upstream errors or times out.
+    Within a deadline, the timeouts of every attempt are cut to the time left.
+    GETs given a hedge key are sent a second time once the first has been
+    running for the hedge_percentile latency of that key, the first response
+    being used.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.3,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        hedge_percentile: Optional[float] = 95,
+    ):
         self.base_url = base_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.circuit_breaker = circuit_breaker
+        self.hedge_percentile = hedge_percentile
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+            )
+        return self.session
+
+    async def _send(
+        self,
+        method: HTTPMethod,
+        path: str,
+        headers: Optional[dict],
+        hedge_key: Optional[str] = None,
+    ) -> Union[Error, HTTPResponse]:
+        # Only idempotent requests are retried, as urllib3 does by default.
+        retries = self.max_retries if method is HTTPMethod.GET else 0
+        if method is not HTTPMethod.GET:
+            hedge_key = None
+        deadline = DEADLINE.get()
+        attempt = 0
+        while True:
+            if self._timeout(deadline) is None:
+                return Error(DEADLINE_EXCEEDED_MESSAGE)
+            if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+                return Error(CIRCUIT_OPEN_MESSAGE)
+            send = functools.partial(
+                self._request, method, path, headers, deadline, hedge_key
+            )
+            try:
+                if hedge_key is None:
+                    response = await send()
+                else:
+                    response = await self._hedged(send, hedge_key, deadline)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = Error(str(e) or e.__class__.__name__)
+                if attempt >= retries:
+                    return error
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    return response
+                error = response.error()
+            backoff = self.backoff_factor * (2**attempt)
+            if deadline is not None and time.monotonic() + backoff >= deadline:
+                return error
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+    def _timeout(self, deadline: Optional[float]) -> Optional[aiohttp.ClientTimeout]:
+        """The timeouts of an attempt, None if the deadline has passed."""
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        return aiohttp.ClientTimeout(
+            total=remaining,
+            sock_connect=min(self.connect_timeout, remaining),
+            sock_read=min(self.read_timeout, remaining),
+        )
+
+    async def _request(
+        self,
+        method: HTTPMethod,
+        path: str,
+        headers: Optional[dict],
+        deadline: Optional[float],
+        hedge_key: Optional[str],
+    ) -> HTTPResponse:
+        started_at = time.monotonic()
+        timeout = self._timeout(deadline)
+        try:
+            if timeout is None:
+                raise asyncio.TimeoutError()
+            async with self._get_session().request(
+                method=method.value,
+                url=f"{self.base_url}{path}",
+                headers=headers if headers else None,
+                timeout=timeout,
+            ) as http_response:
+                response = HTTPResponse(
+                    status_code=http_response.status,
+                    headers=http_response.headers,
+                    body=await http_response.read(),
+                )
+        except asyncio.CancelledError:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.abandon()
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self._record(success=False)
+            raise
+        self._record(success=response.status_code not in RETRY_STATUS_CODES)
+        if hedge_key is not None:
+            self.latencies.setdefault(hedge_key, deque(maxlen=HEDGE_WINDOW)).append(
+                time.monotonic() - started_at
+            )
+        return response
+
+    async def _hedged(
+        self,
+        send: Callable[[], Awaitable[HTTPResponse]],
+        hedge_key: str,
+        deadline: Optional[float],
+    ) -> HTTPResponse:
+        primary = asyncio.ensure_future(send())
+        delay = self._hedge_delay(hedge_key)
+        if delay is None or (
+            deadline is not None and time.monotonic() + delay >= deadline
+        ):
+            return await primary
+        requests = {primary: "primary"}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or (
+                self.circuit_breaker is not None and not self.circuit_breaker.allow()
+            ):
+                return await primary
+            requests[asyncio.ensure_future(send())] = "hedge"
+            pending = set(requests)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for request in done:
+                    if request.exception() is None:
+                        UPSTREAM_HEDGED_REQUESTS.labels(
+                            method=hedge_key, winner=requests[request]
+                        ).inc()
+                        return request.result()
+            # Both failed, the exception of the hedge is dropped.
+            return primary.result()
+        finally:
+            for request in requests:
+                if not request.done():
+                    request.cancel()
 
-    def make_request(
+    def _hedge_delay(self, hedge_key: str) -> Optional[float]:
+        latencies = self.latencies.get(hedge_key)
+        if (
+            self.hedge_percentile is None
+            or latencies is None
+            or len(latencies) < HEDGE_MIN_SAMPLES
+        ):
+            return None
+        ordered = sorted(latencies)
+        index = int(len(ordered) * self.hedge_percentile / 100)
+        return ordered[min(index, len(ordered) - 1)]
+
+    def _record(self, success: bool) -> None:
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(success)
+
+    async def make_request(
         self,
         method: HTTPMethod,
         path: str,
         headers: Optional[dict],
         decoder: Callable[[dict], T],
+        hedge_key: Optional[str] = None,
     ) -> Union[Error, T]:
-        http_response = requests.request(
-            method=method.value,
-            url=f"{self.base_url}{path}",
-            headers=headers if headers else None,
+        http_response = await self._send(
+            method=method, path=path, headers=headers, hedge_key=hedge_key
         )
+        if isinstance(http_response, Error):
+            return http_response
         if http_response.status_code == 200:
-            return decoder(http_response.json())
+            return http_response.decode(decoder)
         else:
-            return Error(http_response.json())
+            return http_response.error()
+
+    async def make_conditional_request(
+        self,
+        method: HTTPMethod,
+        path: str,
+        headers: Optional[dict],
+        decoder: Callable[[dict], T],
+        validators: Optional[CacheValidators],
+        hedge_key: Optional[str] = None,
+    ) -> Union[Error, ConditionalResponse[T]]:
+        request_headers = dict(headers) if headers else {}
+        if validators:
+            request_headers.update(validators.to_headers())
+        http_response = await self._send(
+            method=method, path=path, headers=request_headers, hedge_key=hedge_key
+        )
+        if isinstance(http_response, Error):
+            return http_response
+        if http_response.status_code == 304:
+            return ConditionalResponse(
+                value=None, validators=validators, not_modified=True
+            )
+        elif http_response.status_code == 200:
+            value = http_response.decode(decoder)
+            if isinstance(value, Error):
+                return value
+            return ConditionalResponse(
+                value=value,
+                validators=CacheValidators(
+                    etag=http_response.headers.get("ETag"),
+                    last_modified=http_response.headers.get("Last-Modified"),
+                ),
+                not_modified=False,
+            )
+        else:
+            return http_response.error()
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
@@ -1,24 +1,178 @@
+import hmac
 import logging
+import threading
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from threading import Thread
+from typing import Callable, Dict, Optional, cast
+from urllib.parse import parse_qs, urlsplit
+
+import profiling
+from metrics import export as export_metrics
+from prometheus_client import CONTENT_TYPE_LATEST
+
+MAX_PROFILE_SECONDS = 120
+# Sampling more often would keep the GIL from the threads being profiled.
+MIN_PROFILE_INTERVAL_MS = 1
+MAX_WEBHOOK_BODY_BYTES = 1024 * 1024
+
+# Only one profile at a time: two samplers would measure each other.
+profiling_lock = threading.Lock()
+
+
+def profile_seconds(query: Dict[str, str]) -> float:
+    seconds = float(query.get("seconds", 10))
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_PROFILE_SECONDS}")
+    return seconds
+
+
+def profile_cpu(query: Dict[str, str]) -> str:
+    interval_ms = float(query.get("interval_ms", 5))
+    if not MIN_PROFILE_INTERVAL_MS <= interval_ms <= MAX_PROFILE_SECONDS * 1000:
+        raise ValueError(
+            f"interval_ms must be between {MIN_PROFILE_INTERVAL_MS} and "
+            f"{MAX_PROFILE_SECONDS * 1000}"
+        )
+    return profiling.sample_cpu(
+        seconds=profile_seconds(query),
+        interval=interval_ms / 1000,
+    )
+
+
+def dump_stacks(query: Dict[str, str]) -> str:
+    return profiling.dump_stacks()
+
+
+def top_allocations(query: Dict[str, str]) -> str:
+    return profiling.top_allocations(
+        seconds=profile_seconds(query),
+        limit=int(query.get("limit", 25)),
+    )
+
+
+ADMIN_ROUTES: Dict[str, Callable[[Dict[str, str]], str]] = {
+    "/admin/profile": profile_cpu,
+    "/admin/stacks": dump_stacks,
+    "/admin/tracemalloc": top_allocations,
+}
+
+
+class Webhook:
+    """
+    Route receiving the updates Telegram POSTs, only if they carry the secret
+    token the webhook was registered with.
+    """
+
+    def __init__(self, path: str, secret_token: str, handle: Callable[[bytes], None]):
+        self.path = path
+        self.secret_token = secret_token
+        self.handle = handle
+
+
+class HTTPServer(ThreadingHTTPServer):
+    # Telegram opens up to 40 webhook connections at once, the default backlog
+    # of 5 would reset most of them.
+    request_queue_size = 128
+    daemon_threads = True
+    # The admin routes are only served with a token.
+    admin_token: Optional[str] = None
+    webhook: Optional[Webhook] = None
 
 
 class PythonServer(SimpleHTTPRequestHandler):
+    # Keep-alive, Telegram delivers webhook updates over persistent connections.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
     def do_GET(self):
-        self.send_response(200)
-        self.send_header("Content-type", "text/html")
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            self.send_body(200, CONTENT_TYPE_LATEST, export_metrics())
+            return
+        if url.path in ADMIN_ROUTES:
+            self.handle_admin(url.path, url.query)
+            return
+        self.send_body(
+            200, "text/html", "GET request for {}".format(self.path).encode("utf-8")
+        )
+
+    def do_POST(self):
+        webhook = cast(HTTPServer, self.server).webhook
+        if webhook is None or urlsplit(self.path).path != webhook.path:
+            self.reject(404, "Not found")
+            return
+        secret_token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(secret_token, webhook.secret_token):
+            self.reject(401, "Unauthorized")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.reject(411, "Length required")
+            return
+        if length > MAX_WEBHOOK_BODY_BYTES:
+            self.reject(413, "Payload too large")
+            return
+        try:
+            webhook.handle(self.rfile.read(length))
+        except ValueError as e:
+            self.send_text(400, str(e))
+            return
+        self.send_text(200, "OK")
+
+    def reject(self, status_code: int, text: str):
+        # The request body is left unread, so the connection can't be reused.
+        self.close_connection = True
+        self.send_text(status_code, text)
+
+    def handle_admin(self, path: str, query_string: str):
+        admin_token = cast(HTTPServer, self.server).admin_token
+        if not admin_token:
+            self.send_text(404, "Not found")
+            return
+        authorization = self.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization, f"Bearer {admin_token}"):
+            self.send_text(401, "Unauthorized")
+            return
+        query = {key: values[-1] for key, values in parse_qs(query_string).items()}
+        if not profiling_lock.acquire(blocking=False):
+            self.send_text(409, "Another profile is running")
+            return
+        try:
+            body = ADMIN_ROUTES[path](query)
+        except ValueError as e:
+            self.send_text(400, str(e))
+            return
+        finally:
+            profiling_lock.release()
+        self.send_text(200, body)
+
+    def send_text(self, status_code: int, text: str):
+        self.send_body(status_code, "text/plain; charset=utf-8", text.encode("utf-8"))
+
+    def send_body(self, status_code: int, content_type: str, body: bytes):
+        self.send_response(status_code)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
         self.end_headers()
-        self.wfile.write("GET request for {}".format(self.path).encode("utf-8"))
+        self.wfile.write(body)
 
 
-def start(log: logging.Logger, hostname: str, port: int):
-    server = ThreadingHTTPServer((hostname, port), PythonServer)
+def start(
+    log: logging.Logger, hostname: str, port: int, admin_token: Optional[str] = None
+) -> HTTPServer:
+    """Starts serving in a daemon thread. Set webhook on the server to route it."""
+    server = HTTPServer((hostname, port), PythonServer)
+    server.admin_token = admin_token
     log.info(f"Server started at {hostname}:{port}")
     try:
-        server = Thread(target=server.serve_forever)  # type: ignore
-        server.daemon = True  # type: ignore
-        server.start()  # type: ignore
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
 
     except KeyboardInterrupt:
         server.server_close()
         log.info("Server stopped successfully")
+    return server
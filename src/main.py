@@ -1,30 +1,61 @@
+import datetime
 import os
+import secrets
 import sys
+import time
+from typing import Optional
+from urllib.parse import urlsplit
 
-import requests  # type: ignore
-
+from apscheduler.events import EVENT_SCHEDULER_START
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from bot.handler_executor import HandlerExecutor
 from bot.handlers import get_handlers
-from bot.telegram_bot import Bot
+from bot.lineup_reminders import LineupReminderScheduler
+from bot.outbound_messages import BULK, INTERACTIVE, OutboundMessageScheduler
+from bot.telegram_bot import Bot, webhook_handler
+from circuit_breaker import CircuitBreaker
 
-from core.configuration import Configuration, validate_configuration
+from adapters.persistence.lineup_reminder_subscription_store import (
+    LineupReminderSubscriptionStore,
+)
+from adapters.persistence.race_snapshot_store import RaceSnapshotStore
+from adapters.persistence.session_store import SessionStore
+from adapters.render_cache import RenderCache
+from core.configuration import Configuration, database_url, validate_configuration
+from core.error import Error
+from core.race_calendar import RaceCalendar
+from core.session import Session
 from dotenv import load_dotenv
 
-from http_client import HTTPClient
-from http_server import start as http_server_start
+from event_loop import EventLoopThread
+from http_client import AsyncHTTPClient
+from http_server import start as http_server_start, Webhook
 from logger import create_logger
+from metrics import (
+    watch_cache,
+    watch_circuit_breaker,
+    watch_jobs,
+    watch_queue,
+    watch_single_flight,
+)
 from seleniumwire.undetected_chromedriver import (  # type: ignore
     ChromeOptions as uc_chrome_options,
 )
 
+from services.async_f1_fantasy_service import AsyncF1FantasyService
+from services.drivers_catalog import DriversCatalog
 from services.f1_fantasy_service import F1FantasyService
+from services.race_calendar_service import RaceCalendarService
+from services.session_manager import SessionManager
+from services.standings_history_service import StandingsHistoryService
 from uc_driver import ChromeDriver
 
 LOG_FORMAT = "[%(levelname)s] %(asctime)s - %(filename)s - %(funcName)s: %(message)s"
 
 
 if __name__ == "__main__":
+    started_at = time.monotonic()
     load_dotenv()
 
     configuration = Configuration(env_variables=os.environ)
@@ -38,12 +69,13 @@ if __name__ == "__main__":
     log.info("Startup")
 
     log.info("Starting HTTP server")
-    http_server_start(
+    http_server = http_server_start(
         log=create_logger(
             name="http-server", level=configuration.log.log_level, format=LOG_FORMAT
         ),
         hostname=configuration.http_server.hostname,
         port=configuration.http_server.port,
+        admin_token=configuration.http_server.admin_token,
     )
 
     chrome_options = uc_chrome_options()
@@ -54,59 +86,253 @@ if __name__ == "__main__":
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--disable-web-security")
     seleniumwire_options = {"connection_keep_alive": True, "disable_encoding": True}
-    driver = ChromeDriver(
-        options=chrome_options, seleniumwire_options=seleniumwire_options
-    )
 
-    log.info("Scheduling restart")
+    def login() -> Optional[Session]:
+        log.info("Performing login")
+        driver = ChromeDriver(
+            options=chrome_options, seleniumwire_options=seleniumwire_options
+        )
+        try:
+            driver.login(
+                url=configuration.f1_fantasy.login_url,
+                credentials=configuration.f1_fantasy.credentials,
+            )
+            return driver.get_player_session()
+        finally:
+            driver.quit()
+
     scheduler = BackgroundScheduler()
-    scheduler.add_job(func=driver.reboot, trigger="interval", hours=24)
     scheduler.start()
 
-    log.info("Performing login")
-    driver.login(
-        url=configuration.f1_fantasy.login_url,
-        credentials=configuration.f1_fantasy.credentials,
+    outbound_scheduler = OutboundMessageScheduler(
+        logger=create_logger(
+            "outbound-messages", level=configuration.log.log_level, format=LOG_FORMAT
+        ),
+        senders=configuration.bot.outbound_senders,
+        messages_per_second=configuration.bot.outbound_messages_per_second,
+        bulk_messages_per_second=configuration.bot.broadcast_messages_per_second,
     )
-    cookies = driver.get_player_cookie()
-    driver.close()
+    outbound_scheduler.start()
 
     fantasy_bot = Bot(
-        api_key=configuration.bot.api_key, db_config=configuration.db_config
+        api_key=configuration.bot.api_key,
+        db_config=configuration.db_config,
+        outbound_scheduler=outbound_scheduler,
+        # The senders, the handler workers, the dispatcher and the jobs call
+        # the Bot API.
+        con_pool_size=configuration.bot.outbound_senders
+        + configuration.bot.handler_workers
+        + 4,
     )
 
-    log.info("Loading drivers")
+    log.info("Starting asyncio event loop")
+    event_loop = EventLoopThread()
+    event_loop.start()
 
-    f1_drivers_req = requests.get(
-        url="https://fantasy.formula1.com/feeds/drivers/1_en.json?buster=20230227110410",
-        cookies={"Cookie": cookies},
-    )
-
-    f1_drivers = f1_drivers_req.json()["Data"]["Value"]
-    f1_all_drivers = {}
-    for f1_driver in f1_drivers:
-        f1_all_drivers[int(f1_driver["PlayerId"])] = f1_driver
     log.info("Creating F1 Fantasy base HTTP client")
-    f1_fantasy_http_client = HTTPClient(
+    f1_fantasy_circuit_breaker = CircuitBreaker(
+        failure_rate=configuration.http_client.circuit_failure_rate,
+        window=configuration.http_client.circuit_window,
+        min_requests=configuration.http_client.circuit_min_requests,
+        open_seconds=configuration.http_client.circuit_open_seconds,
+    )
+    f1_fantasy_http_client = AsyncHTTPClient(
         base_url="https://fantasy.formula1.com",
+        pool_size=configuration.http_client.pool_size,
+        connect_timeout=configuration.http_client.connect_timeout,
+        read_timeout=configuration.http_client.read_timeout,
+        max_retries=configuration.http_client.max_retries,
+        backoff_factor=configuration.http_client.backoff_factor,
+        circuit_breaker=f1_fantasy_circuit_breaker,
+        hedge_percentile=configuration.http_client.hedge_percentile,
     )
+    race_snapshot_store = RaceSnapshotStore(url=database_url(configuration.db_config))
+
     log.info("Creating Season Service")
-    f1_fantasy_service = F1FantasyService(
+    async_f1_fantasy_service = AsyncF1FantasyService(
         http_client=f1_fantasy_http_client,
         logger=create_logger(
             "f1-fantasy-service", level=configuration.log.log_level, format=LOG_FORMAT
         ),
-        cookies=cookies,
+        cookies="",
         league_id=configuration.f1_fantasy.league_id,
+        schedule_ttl=configuration.cache.schedule_ttl,
+        leaderboard_cache_size=configuration.cache.leaderboard_max_entries,
+        leaderboard_live_ttl=configuration.cache.leaderboard_live_ttl,
+        fan_out_concurrency=configuration.f1_fantasy.fan_out_concurrency,
+        leaderboard_page_size=configuration.f1_fantasy.leaderboard_page_size,
+        leaderboard_prefetch_window=configuration.f1_fantasy.leaderboard_prefetch_window,
+        session_renewer=lambda stale_cookie: session_manager.renew(stale_cookie),
+        snapshot_store=race_snapshot_store,
+        stale_timeout=configuration.cache.stale_timeout,
+    )
+    f1_fantasy_service = F1FantasyService(
+        async_service=async_f1_fantasy_service, event_loop=event_loop
     )
 
+    session_manager = SessionManager(
+        login=login,
+        scheduler=scheduler,
+        logger=create_logger(
+            "session-manager", level=configuration.log.log_level, format=LOG_FORMAT
+        ),
+    )
+    session_manager.add_listener(
+        lambda new_session: setattr(f1_fantasy_service, "cookies", new_session.cookie)
+    )
+    account = configuration.f1_fantasy.credentials.username
+    stored_session = None
+    if configuration.session.encryption_key:
+        session_store = SessionStore(
+            url=database_url(configuration.db_config),
+            encryption_key=configuration.session.encryption_key,
+        )
+        session_manager.add_listener(
+            lambda new_session: session_store.save(account, new_session)
+        )
+        stored_session = session_store.load(account)
+
+    if (
+        stored_session is not None
+        and (
+            stored_session.expires_at is None
+            or stored_session.expires_at
+            > datetime.datetime.now(tz=datetime.timezone.utc)
+        )
+        and f1_fantasy_service.is_session_valid(stored_session.cookie)
+    ):
+        log.info("Reusing stored login session")
+        session_manager.adopt(stored_session)
+    elif session_manager.renew() is None:
+        log.error("Unable to login to F1 Fantasy")
+        sys.exit()
+
+    log.info("Loading race calendar")
+    race_calendar_service = RaceCalendarService(
+        f1_fantasy_service=f1_fantasy_service,
+        scheduler=scheduler,
+        logger=create_logger(
+            "race-calendar", level=configuration.log.log_level, format=LOG_FORMAT
+        ),
+    )
+    race_calendar_service.refresh()
+
+    log.info("Loading drivers")
+    drivers_catalog = DriversCatalog(
+        f1_fantasy_service=f1_fantasy_service,
+        logger=create_logger(
+            "drivers-catalog", level=configuration.log.log_level, format=LOG_FORMAT
+        ),
+    )
+    drivers_catalog.refresh()
+    scheduler.add_job(
+        func=drivers_catalog.refresh,
+        trigger="interval",
+        minutes=configuration.f1_fantasy.drivers_refresh_interval,
+    )
+
+    def refresh_drivers(calendar: RaceCalendar) -> None:
+        diff = drivers_catalog.refresh()
+        if isinstance(diff, Error):
+            log.error(f"Drivers refresh on race status change failed: {diff.message}")
+
+    race_calendar_service.add_listener(refresh_drivers)
+
+    standings_history_service = StandingsHistoryService(
+        f1_fantasy_service=f1_fantasy_service,
+        logger=create_logger(
+            "standings-history", level=configuration.log.log_level, format=LOG_FORMAT
+        ),
+        snapshot_store=race_snapshot_store,
+    )
+    # The backfill of past races runs in the background, not to delay startup.
+    scheduler.add_job(
+        func=standings_history_service.refresh, args=[race_calendar_service.calendar]
+    )
+
+    def refresh_standings_history(calendar: RaceCalendar) -> None:
+        history = standings_history_service.refresh(calendar)
+        if isinstance(history, Error):
+            log.error(
+                f"Standings history refresh on race status change failed: "
+                f"{history.message}"
+            )
+
+    race_calendar_service.add_listener(refresh_standings_history)
+
+    render_cache = RenderCache(max_entries=configuration.cache.render_max_entries)
+
+    lineup_reminder_scheduler = LineupReminderScheduler(
+        job_queue=fantasy_bot.dispatcher.job_queue,
+        jobstore=fantasy_bot.jobstore,
+        subscription_store=LineupReminderSubscriptionStore(
+            url=database_url(configuration.db_config)
+        ),
+        logger=create_logger(
+            "lineup-reminders", level=configuration.log.log_level, format=LOG_FORMAT
+        ),
+    )
+    # The job queue starts with the bot: jobs are migrated and scheduled then.
+    fantasy_bot.dispatcher.job_queue.scheduler.add_listener(
+        lambda _: lineup_reminder_scheduler.start(
+            race_calendar_service.calendar.races_after(datetime.datetime.now())
+        ),
+        EVENT_SCHEDULER_START,
+    )
+    race_calendar_service.add_listener(
+        lambda calendar: lineup_reminder_scheduler.schedule(
+            calendar.races_after(datetime.datetime.now())
+        )
+    )
+
+    handler_executor = HandlerExecutor(
+        workers=configuration.bot.handler_workers,
+        queue_size=configuration.bot.handler_queue_size,
+        logger=create_logger(
+            "handler-executor", level=configuration.log.log_level, format=LOG_FORMAT
+        ),
+    )
+    handler_executor.start()
+
     log.info("Telegram registering handlers")
     handlers = get_handlers(
-        drivers=f1_all_drivers,
+        drivers_catalog=drivers_catalog,
         f1_fantasy_service=f1_fantasy_service,
+        race_calendar_service=race_calendar_service,
+        render_cache=render_cache,
+        standings_history_service=standings_history_service,
+        lineup_reminder_scheduler=lineup_reminder_scheduler,
+        handler_executor=handler_executor,
     )
     for handler in handlers:
         fantasy_bot.dispatcher.add_handler(handler=handler)
 
+    watch_cache("season_races", async_f1_fantasy_service.season_races_cache.stats)
+    watch_cache("leaderboard", async_f1_fantasy_service.leaderboard_cache.stats)
+    watch_cache("render", render_cache.stats)
+    watch_circuit_breaker("f1_fantasy", f1_fantasy_circuit_breaker.stats)
+    watch_single_flight("f1_fantasy", async_f1_fantasy_service.single_flight.stats)
+    watch_queue("dispatcher_updates", fantasy_bot.dispatcher.update_queue.qsize)
+    watch_queue("handler_updates", handler_executor.queue.qsize)
+    watch_queue("outbound_interactive", lambda: outbound_scheduler.depth(INTERACTIVE))
+    watch_queue("outbound_bulk", lambda: outbound_scheduler.depth(BULK))
+    watch_jobs("telegram", fantasy_bot.jobstore.count_jobs)
+    watch_jobs("background", lambda: len(scheduler.get_jobs()))
+
+    log.info(f"Startup completed in {time.monotonic() - started_at:.2f}s")
     log.info("Starting bot")
-    fantasy_bot.start_bot()
+    webhook_url = configuration.bot.webhook_url
+    secret_token = configuration.bot.webhook_secret_token or secrets.token_urlsafe(32)
+    if webhook_url:
+        http_server.webhook = Webhook(
+            path=urlsplit(webhook_url).path or "/",
+            secret_token=secret_token,
+            handle=webhook_handler(fantasy_bot.dispatcher),
+        )
+    fantasy_bot.start_bot(
+        webhook_url=webhook_url,
+        secret_token=secret_token,
+        max_connections=configuration.bot.webhook_max_connections,
+    )
+    # The replies queued before stopping are still sent.
+    outbound_scheduler.stop()
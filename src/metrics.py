@@ -0,0 +1,240 @@
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import psutil
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+
+REGISTRY = CollectorRegistry()
+
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "f1_fantasy_upstream_request_duration_seconds",
+    "Duration of the requests to the F1 Fantasy API, by service method.",
+    ["method"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    registry=REGISTRY,
+)
+UPSTREAM_RESPONSES = Counter(
+    "f1_fantasy_upstream_responses",
+    "Responses of the F1 Fantasy API, by service method and status code.",
+    ["method", "status"],
+    registry=REGISTRY,
+)
+UPSTREAM_HEDGED_REQUESTS = Counter(
+    "f1_fantasy_upstream_hedged_requests",
+    "Requests sent twice after the p95 latency, by service method and winner.",
+    ["method", "winner"],
+    registry=REGISTRY,
+)
+STALE_RESPONSES = Counter(
+    "f1_fantasy_stale_responses",
+    "Last good responses served in place of a fresh one, by service method.",
+    ["method"],
+    registry=REGISTRY,
+)
+HANDLER_DURATION = Histogram(
+    "telegram_handler_duration_seconds",
+    "Time spent handling a Telegram update, by command.",
+    ["command"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    registry=REGISTRY,
+)
+HANDLER_SHED = Counter(
+    "telegram_handler_shed_updates",
+    "Updates answered busy because the handler queue was full, by command.",
+    ["command"],
+    registry=REGISTRY,
+)
+OUTBOUND_DELIVERY_DURATION = Histogram(
+    "telegram_outbound_delivery_seconds",
+    "Time from queueing a message to Telegram accepting it, by priority.",
+    ["priority"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+    registry=REGISTRY,
+)
+OUTBOUND_RETRIES = Counter(
+    "telegram_outbound_retries",
+    "Messages queued again after a retry_after response.",
+    registry=REGISTRY,
+)
+OUTBOUND_MERGED_MESSAGES = Counter(
+    "telegram_outbound_merged_messages",
+    "Messages sent along the previous one queued to the same chat.",
+    registry=REGISTRY,
+)
+
+
+class StateCollector:
+    """
+    Metrics read from the live objects only when scraped, so keeping them
+    costs nothing between two scrapes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families: Dict[
+            str, Tuple[type, str, List[str], List[Tuple[List[str], Callable]]]
+        ] = {}
+
+    def add(
+        self,
+        name: str,
+        documentation: str,
+        read: Callable[[], float],
+        labels: Optional[Dict[str, str]] = None,
+        family: type = GaugeMetricFamily,
+    ) -> None:
+        labels = labels or {}
+        with self.lock:
+            _, _, label_names, samples = self.families.setdefault(
+                name, (family, documentation, sorted(labels), [])
+            )
+            samples.append(([labels[label] for label in label_names], read))
+
+    def collect(self) -> Iterator[Metric]:
+        with self.lock:
+            families = [
+                (name, family, documentation, label_names, list(samples))
+                for name, (family, documentation, label_names, samples) in (
+                    self.families.items()
+                )
+            ]
+        for name, family, documentation, label_names, samples in families:
+            metric = family(name, documentation, labels=label_names)
+            for label_values, read in samples:
+                try:
+                    value = read()
+                except Exception:
+                    # e.g. the database is down: skip the sample, not the scrape.
+                    continue
+                metric.add_metric(label_values, value)
+            yield metric
+
+
+STATE = StateCollector()
+REGISTRY.register(STATE)
+
+_process = psutil.Process()
+STATE.add(
+    "process_resident_memory_bytes",
+    "Resident memory size in bytes.",
+    lambda: _process.memory_info().rss,
+)
+
+
+def watch_cache(name: str, stats: Callable[[], dict]) -> None:
+    labels = {"cache": name}
+    STATE.add(
+        "cache_hits",
+        "Cache lookups served from the cache.",
+        lambda: stats()["hits"],
+        labels=labels,
+        family=CounterMetricFamily,
+    )
+    STATE.add(
+        "cache_misses",
+        "Cache lookups that had to compute or fetch the value.",
+        lambda: stats()["misses"],
+        labels=labels,
+        family=CounterMetricFamily,
+    )
+
+    def hit_ratio() -> float:
+        cache_stats = stats()
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        return cache_stats["hits"] / lookups if lookups else 0.0
+
+    STATE.add(
+        "cache_hit_ratio",
+        "Share of the cache lookups served from the cache.",
+        hit_ratio,
+        labels=labels,
+    )
+    # Of the conditional caches only.
+    if "revalidations" in stats():
+        STATE.add(
+            "cache_revalidations",
+            "Cached values confirmed unchanged by a conditional request.",
+            lambda: stats()["revalidations"],
+            labels=labels,
+            family=CounterMetricFamily,
+        )
+    if "stale" in stats():
+        STATE.add(
+            "cache_stale_hits",
+            "Lookups served the cached value while revalidating it or upstream failed.",
+            lambda: stats()["stale"],
+            labels=labels,
+            family=CounterMetricFamily,
+        )
+
+
+def watch_single_flight(name: str, stats: Callable[[], dict]) -> None:
+    labels = {"service": name}
+    STATE.add(
+        "single_flight_executed_calls",
+        "Calls sent while no identical one was in flight.",
+        lambda: stats()["executed"],
+        labels=labels,
+        family=CounterMetricFamily,
+    )
+    STATE.add(
+        "single_flight_merged_calls",
+        "Calls answered by an identical one already in flight.",
+        lambda: stats()["merged"],
+        labels=labels,
+        family=CounterMetricFamily,
+    )
+
+
+def watch_queue(name: str, depth: Callable[[], int]) -> None:
+    STATE.add(
+        "queue_depth",
+        "Items waiting in a queue.",
+        depth,
+        labels={"queue": name},
+    )
+
+
+def watch_circuit_breaker(name: str, stats: Callable[[], dict]) -> None:
+    labels = {"upstream": name}
+    STATE.add(
+        "circuit_breaker_state",
+        "State of the circuit to an upstream: 0 closed, 1 half-open, 2 open.",
+        lambda: stats()["state"],
+        labels=labels,
+    )
+    STATE.add(
+        "circuit_breaker_rejected_requests",
+        "Requests failed without being sent because the circuit was open.",
+        lambda: stats()["rejected"],
+        labels=labels,
+        family=CounterMetricFamily,
+    )
+
+
+def watch_jobs(name: str, count: Callable[[], int]) -> None:
+    STATE.add(
+        "scheduled_jobs",
+        "Jobs currently scheduled, by scheduler.",
+        count,
+        labels={"scheduler": name},
+    )
+
+
+def timed_handler(command: str, callback: Callable) -> Callable:
+    histogram = HANDLER_DURATION.labels(command=command)
+
+    def timed(update, context):
+        started_at = time.perf_counter()
+        try:
+            return callback(update, context)
+        finally:
+            histogram.observe(time.perf_counter() - started_at)
+
+    return timed
+
+
+def export() -> bytes:
+    return generate_latest(REGISTRY)
@@ -0,0 +1,74 @@
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+
+def _thread_names() -> dict:
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def _folded_stack(thread_name: str, frame: Optional[FrameType]) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join([thread_name] + frames[::-1])
+
+
+def sample_cpu(seconds: float, interval: float = 0.005) -> str:
+    """
+    Samples the stacks of all the threads for the given time and returns them in
+    the folded format read by flamegraph.pl and speedscope. Nothing runs
+    outside of the call.
+    """
+    samples: Counter = Counter()
+    own_ident = threading.get_ident()
+    names = _thread_names()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if ident not in names:
+                names = _thread_names()
+            samples[_folded_stack(names.get(ident, str(ident)), frame)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+def dump_stacks() -> str:
+    names = _thread_names()
+    dumps = []
+    for ident, frame in sys._current_frames().items():
+        stack = "".join(traceback.format_stack(frame))
+        dumps.append(f"Thread {names.get(ident, ident)} ({ident}):\n{stack}")
+    return "\n".join(dumps)
+
+
+def top_allocations(seconds: float, limit: int = 25) -> str:
+    """
+    Top allocation sites by size. Tracing is only enabled for the given time,
+    unless it was already running, in which case it is left as it was.
+    """
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        if not already_tracing:
+            time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.statistics("lineno")
+    total = sum(stat.size for stat in stats)
+    lines = [f"Total traced: {total / 1024:.1f} KiB"]
+    lines += [str(stat) for stat in stats[:limit]]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,515 @@
+import asyncio
+import copy
+import datetime
+import time
+from logging import Logger
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from adapters.driver_adapters import to_drivers
+from adapters.leaderboard_adapters import to_league_standings
+from adapters.persistence.race_snapshot_store import RaceSnapshotStore
+from adapters.picked_player_adapters import lineup_to_picked_players, to_lineup
+from adapters.season_adapters import to_races
+from core.driver import Driver
+from core.error import Error
+from core.leaderboard_entrants import LeaderboardEntrant
+from core.league_standing import LeagueStanding
+from core.picked_player import PickedPlayer
+from core.race import Race, RaceStatus
+from core.race_calendar import RaceCalendar
+from http_client import (
+    DEADLINE,
+    AsyncHTTPClient,
+    CacheValidators,
+    ConditionalResponse,
+    HTTPMethod,
+    within_deadline,
+)
+from metrics import STALE_RESPONSES, UPSTREAM_REQUEST_DURATION, UPSTREAM_RESPONSES
+from services.cache import ConditionalCache, LRUCache
+from services.single_flight import SingleFlight
+
+LEAGUE_ID = "14886408"
+UNAUTHORIZED_STATUS_CODES = (401, 403)
+
+R = TypeVar("R")
+S = TypeVar("S", bound=LeagueStanding)
+
+
+class AsyncF1FantasyService:
+    def __init__(
+        self,
+        http_client: AsyncHTTPClient,
+        logger: Logger,
+        cookies: str,
+        league_id: str,
+        schedule_ttl: float = 3600,
+        leaderboard_cache_size: int = 256,
+        leaderboard_live_ttl: float = 60,
+        fan_out_concurrency: int = 5,
+        leaderboard_page_size: int = 100,
+        leaderboard_prefetch_window: int = 3,
+        session_renewer: Optional[Callable[[str], None]] = None,
+        snapshot_store: Optional[RaceSnapshotStore] = None,
+        stale_timeout: float = 2,
+    ):
+        self.http_client = http_client
+        self.logger = logger
+        self.cookies = cookies
+        self.league_id = league_id
+        self.season_races_cache: ConditionalCache[List[Race]] = ConditionalCache(
+            ttl=schedule_ttl
+        )
+        # Standings, and lineups as the ids of the players picked.
+        self.leaderboard_cache: LRUCache[Union[LeagueStanding, List[str]]] = LRUCache(
+            max_entries=leaderboard_cache_size
+        )
+        self.leaderboard_live_ttl = leaderboard_live_ttl
+        self.fan_out_concurrency = fan_out_concurrency
+        self.leaderboard_page_size = leaderboard_page_size
+        self.leaderboard_prefetch_window = leaderboard_prefetch_window
+        self.session_renewer = session_renewer
+        self.snapshot_store = snapshot_store
+        self.single_flight = SingleFlight()
+        # The last good standings, with when they were fetched: of the type
+        # their fetch returns.
+        self.last_good_standings: LRUCache[Tuple[Any, float]] = LRUCache(
+            max_entries=leaderboard_cache_size
+        )
+        self.standing_refreshes: Dict[Hashable, asyncio.Future] = {}
+        self.stale_timeout = stale_timeout
+
+    """Get the races for the season."""
+
+    async def get_season_races(self) -> Union[Error, List[Race]]:
+        return await self.season_races_cache.get(self._fetch_season_races)
+
+    """Get the races for the season, revalidating the cached schedule."""
+
+    async def refresh_season_races(self) -> Union[Error, List[Race]]:
+        self.season_races_cache.expire()
+        return await self.get_season_races()
+
+    async def _fetch_season_races(
+        self, validators: Optional[CacheValidators]
+    ) -> Union[Error, ConditionalResponse[List[Race]]]:
+        self.logger.debug("Getting all season")
+        return await self._authenticated(
+            "get_season_races",
+            lambda cookies: self.http_client.make_conditional_request(
+                method=HTTPMethod.GET,
+                path="/feeds/schedule/raceday_en.json",
+                headers={"Cookie": cookies},
+                decoder=to_races,
+                validators=validators,
+                hedge_key="get_season_races",
+            ),
+        )
+
+    """Get the last completed race"""
+
+    async def get_last_completed_race(
+        self, now: datetime.datetime
+    ) -> Union[Error, Race]:
+        races = await self.get_season_races()
+        if isinstance(races, Error):
+            return races
+        last_race = RaceCalendar(races).last_completed(now)
+        if last_race is None:
+            return Error("There are no completed races")
+        return last_race
+
+    """Get the top of the league standing"""
+
+    async def get_league_standing(
+        self, limit: int = 10
+    ) -> Union[Error, LeagueStanding]:
+        self.logger.debug("Get league standing")
+        return await self._revalidated(
+            key=("league_standing", self.league_id, limit),
+            method="get_league_standing",
+            fetch=lambda: self._top_entrants(
+                self.iter_league_standing(
+                    page_size=min(limit, self.leaderboard_page_size), limit=limit
+                )
+            ),
+        )
+
+    """Iterate over the whole league standing, page by page"""
+
+    def iter_league_standing(
+        self, page_size: Optional[int] = None, limit: Optional[int] = None
+    ) -> AsyncIterator[Union[Error, LeaderboardEntrant]]:
+        return self._iter_leaderboard(
+            method="get_league_standing",
+            path=lambda page, size: f"/services/user/leaderboard/{self.league_id}/pvtleagueuserrankget/1/2102210/0/1/{page}/{size}/",  # noqa: E501
+            page_size=page_size or self.leaderboard_page_size,
+            limit=limit,
+        )
+
+    """Check that a session cookie is accepted upstream"""
+
+    async def is_session_valid(self, cookies: str) -> bool:
+        standing = await self._observed(
+            "is_session_valid",
+            self.http_client.make_request(
+                method=HTTPMethod.GET,
+                path=f"/services/user/leaderboard/{self.league_id}/pvtleagueuserrankget/1/2102210/0/1/1/10/",  # noqa: E501
+                headers={"Cookie": cookies},
+                decoder=to_league_standings,
+            ),
+        )
+        return not isinstance(standing, Error)
+
+    """Get the top of the last race standing"""
+
+    async def get_last_race_standing(
+        self, race_id: int, limit: int = 10
+    ) -> Union[Error, LeagueStanding]:
+        key = (self.league_id, race_id, limit)
+        cached = self.leaderboard_cache.get(key)
+        if isinstance(cached, LeagueStanding):
+            return cached
+        # Only completed races are snapshotted, so a snapshot needs no schedule
+        # lookup: it keeps serving while the fantasy API is down.
+        if self.snapshot_store is not None:
+            snapshot = await self._snapshot(
+                self.snapshot_store.load_standing, self.league_id, race_id, limit
+            )
+            if snapshot is not None:
+                self.leaderboard_cache.put(key, snapshot, ttl=None)
+                return snapshot
+        self.logger.debug("Getting last race standing")
+        standing = await self._revalidated(
+            key=("last_race_standing", *key),
+            method="get_last_race_standing",
+            fetch=lambda: self._top_entrants(
+                self.iter_last_race_standing(
+                    race_id=race_id,
+                    page_size=min(limit, self.leaderboard_page_size),
+                    limit=limit,
+                )
+            ),
+        )
+        if not isinstance(standing, Error) and standing.age is None:
+            completed = await self._is_race_completed(race_id)
+            if completed and self.snapshot_store is not None:
+                await self._snapshot(
+                    self.snapshot_store.save_standing,
+                    self.league_id,
+                    race_id,
+                    standing.entrants,
+                    len(standing.entrants) < limit,
+                )
+            self.leaderboard_cache.put(
+                key, standing, ttl=None if completed else self.leaderboard_live_ttl
+            )
+        return standing
+
+    """Iterate over the whole last race standing, page by page"""
+
+    def iter_last_race_standing(
+        self,
+        race_id: int,
+        page_size: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[Union[Error, LeaderboardEntrant]]:
+        return self._iter_leaderboard(
+            method="get_last_race_standing",
+            path=lambda page, size: f"/services/user/leaderboard/{self.league_id}/pvtleagueuserrankget/{race_id}/{LEAGUE_ID}/1/1/{page}/{size}/",  # noqa: E501
+            page_size=page_size or self.leaderboard_page_size,
+            limit=limit,
+        )
+
+    """Get the last race standing "of a single team"""
+
+    async def get_last_race_team_standing(
+        self, race_id: int, user_id: str, f1_drivers: Dict[int, Driver]
+    ) -> Union[Error, List[PickedPlayer]]:
+        player_ids = await self._get_lineup(race_id, user_id)
+        if isinstance(player_ids, Error):
+            return player_ids
+        # Scored with the drivers at hand, as points can be revised after a race.
+        try:
+            return lineup_to_picked_players(player_ids, f1_drivers)
+        except KeyError as e:
+            return Error(f"Unknown player {e}")
+
+    async def _get_lineup(self, race_id: int, user_id: str) -> Union[Error, List[str]]:
+        key = (self.league_id, race_id, user_id)
+        cached = self.leaderboard_cache.get(key)
+        if isinstance(cached, list):
+            return cached
+        # Only completed races are snapshotted, so a snapshot needs no schedule
+        # lookup: it keeps serving while the fantasy API is down.
+        if self.snapshot_store is not None:
+            snapshot = await self._snapshot(
+                self.snapshot_store.load_lineup, self.league_id, race_id, user_id
+            )
+            if snapshot is not None:
+                self.leaderboard_cache.put(key, snapshot, ttl=None)
+                return snapshot
+        self.logger.debug("Getting last race team standing")
+        player_ids = await self._get(
+            method="get_last_race_team_standing",
+            path=f"/services/user/opponentteam/opponentgamedayplayerteamget/{race_id}/{user_id}/1/1/1",  # noqa: E501 TO BE CHECKED AFTER SECOND RACE
+            decoder=to_lineup,
+        )
+        if not isinstance(player_ids, Error):
+            completed = await self._is_race_completed(race_id)
+            if completed and self.snapshot_store is not None:
+                await self._snapshot(
+                    self.snapshot_store.save_lineup,
+                    self.league_id,
+                    race_id,
+                    user_id,
+                    player_ids,
+                )
+            self.leaderboard_cache.put(
+                key,
+                player_ids,
+                ttl=None if completed else self.leaderboard_live_ttl,
+            )
+        return player_ids
+
+    """Get the drivers and constructors of the game"""
+
+    async def get_drivers(self) -> Union[Error, Dict[int, Driver]]:
+        self.logger.debug("Getting drivers")
+        buster = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        return await self._get(
+            method="get_drivers",
+            path=f"/feeds/drivers/1_en.json?buster={buster}",
+            decoder=to_drivers,
+        )
+
+    """Get the last race standing of several teams at once"""
+
+    async def get_last_race_team_standings(
+        self, race_id: int, user_ids: List[str], f1_drivers: Dict[int, Driver]
+    ) -> Dict[str, Union[Error, List[PickedPlayer]]]:
+        # Requests run concurrently, at most fan_out_concurrency at a time.
+        semaphore = asyncio.Semaphore(self.fan_out_concurrency)
+
+        async def get_team_standing(user_id: str) -> Union[Error, List[PickedPlayer]]:
+            async with semaphore:
+                return await self.get_last_race_team_standing(
+                    race_id=race_id, user_id=user_id, f1_drivers=f1_drivers
+                )
+
+        team_standings = await asyncio.gather(
+            *[get_team_standing(user_id) for user_id in user_ids]
+        )
+        return dict(zip(user_ids, team_standings))
+
+    async def _iter_leaderboard(
+        self,
+        method: str,
+        path: Callable[[int, int], str],
+        page_size: int,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[Union[Error, LeaderboardEntrant]]:
+        """
+        Yields the entrants page by page, at most limit of them, ending with an
+        Error if a page fails.
+        The first page is requested alone so that top-N readers pay for one
+        request; once it comes back full, the following pages are prefetched
+        leaderboard_prefetch_window at a time. At most that many pages are held
+        in memory, whatever the size of the league. With a limit, no page past
+        it is requested.
+        """
+        pages: Deque[asyncio.Future] = deque()
+        next_page = 1
+        last_page = -(-limit // page_size) if limit else None
+        yielded = 0
+
+        def prefetch() -> None:
+            nonlocal next_page
+            pages.append(
+                asyncio.ensure_future(
+                    self._get(
+                        method=method,
+                        path=path(next_page, page_size),
+                        decoder=to_league_standings,
+                    )
+                )
+            )
+            next_page += 1
+
+        prefetch()
+        # Pages prefetched past the end, or past the point where the reader
+        # stopped, are left to complete: cancelling them would also cancel any
+        # identical request coalesced onto them.
+        while pages:
+            standing = await pages.popleft()
+            if isinstance(standing, Error):
+                yield standing
+                return
+            for entrant in standing.entrants:
+                if yielded == limit:
+                    return
+                yield entrant
+                yielded += 1
+            if len(standing.entrants) < page_size:
+                return
+            while len(pages) < self.leaderboard_prefetch_window and (
+                last_page is None or next_page <= last_page
+            ):
+                prefetch()
+
+    @staticmethod
+    async def _top_entrants(
+        entrants: AsyncIterator[Union[Error, LeaderboardEntrant]]
+    ) -> Union[Error, LeagueStanding]:
+        top: List[LeaderboardEntrant] = []
+        async for entrant in entrants:
+            if isinstance(entrant, Error):
+                return entrant
+            top.append(entrant)
+        return LeagueStanding(entrants=top)
+
+    async def _revalidated(
+        self,
+        key: Hashable,
+        method: str,
+        fetch: Callable[[], Awaitable[Union[Error, S]]],
+    ) -> Union[Error, S]:
+        """
+        Fetches the standing, kept as the last good one. The last good one is
+        served instead, marked with its age, while another caller is fetching
+        it, or if fetching fails, e.g. while the circuit is open, or is still
+        running after stale_timeout: it then goes on in the background.
+        """
+        last_good: Optional[Tuple[S, float]] = self.last_good_standings.get(key)
+        refresh: Optional[
+            "asyncio.Future[Union[Error, S]]"
+        ] = self.standing_refreshes.get(key)
+        if refresh is None:
+            refresh = asyncio.ensure_future(self._refresh_standing(key, fetch))
+            self.standing_refreshes[key] = refresh
+            if last_good is not None:
+                await asyncio.wait({refresh}, timeout=self.stale_timeout)
+        if last_good is None:
+            return await asyncio.shield(refresh)
+        if refresh.done() and not isinstance(refresh.result(), Error):
+            return refresh.result()
+        standing, fetched_at = last_good
+        STALE_RESPONSES.labels(method=method).inc()
+        stale = copy.copy(standing)
+        stale.age = time.monotonic() - fetched_at
+        return stale
+
+    async def _refresh_standing(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Union[Error, S]]],
+    ) -> Union[Error, S]:
+        try:
+            standing = await fetch()
+        finally:
+            del self.standing_refreshes[key]
+        if not isinstance(standing, Error):
+            self.last_good_standings.put(key, (standing, time.monotonic()), ttl=None)
+        return standing
+
+    async def _get(
+        self, method: str, path: str, decoder: Callable[[dict], R]
+    ) -> Union[Error, R]:
+        # Identical requests already in flight are joined instead of repeated.
+        return await self.single_flight.do(
+            key=(path, self.cookies),
+            call=lambda: self._authenticated(
+                method,
+                lambda cookies: self.http_client.make_request(
+                    method=HTTPMethod.GET,
+                    path=path,
+                    headers={"Cookie": cookies},
+                    decoder=decoder,
+                    hedge_key=method,
+                ),
+            ),
+        )
+
+    async def _authenticated(
+        self, method: str, send: Callable[[str], Awaitable[Union[Error, R]]]
+    ) -> Union[Error, R]:
+        """
+        Send with the current cookie; on 401/403 renew the session and retry
+        once. Within a deadline, the renewal is waited for until the deadline
+        and the retry gets the time the call had left when it started.
+        """
+        deadline = DEADLINE.get()
+        budget = None if deadline is None else deadline - time.monotonic()
+        cookies = self.cookies
+        response = await self._observed(method, send(cookies))
+        if (
+            isinstance(response, Error)
+            and response.status_code in UNAUTHORIZED_STATUS_CODES
+            and self.session_renewer is not None
+        ):
+            self.logger.warning("Session rejected upstream, renewing it")
+            # The renewal drives a browser, keep it off the event loop.
+            renewal = asyncio.get_running_loop().run_in_executor(
+                None, self.session_renewer, cookies
+            )
+            if deadline is None:
+                await renewal
+            else:
+                try:
+                    await asyncio.wait_for(renewal, max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    # The login goes on in its thread, the next calls use it.
+                    return response
+            if self.cookies != cookies:
+                retry = send(self.cookies)
+                if budget is not None:
+                    retry = within_deadline(budget, retry)
+                response = await self._observed(method, retry)
+        return response
+
+    @staticmethod
+    async def _observed(method: str, request: Awaitable[R]) -> R:
+        started_at = time.perf_counter()
+        response = await request
+        UPSTREAM_REQUEST_DURATION.labels(method=method).observe(
+            time.perf_counter() - started_at
+        )
+        if isinstance(response, Error):
+            status = str(response.status_code) if response.status_code else "error"
+        elif isinstance(response, ConditionalResponse) and response.not_modified:
+            status = "304"
+        else:
+            status = "200"
+        UPSTREAM_RESPONSES.labels(method=method, status=status).inc()
+        return response
+
+    async def _is_race_completed(self, race_id: int) -> bool:
+        """Results of a completed race never change: they are cached forever."""
+        races = await self.get_season_races()
+        if not isinstance(races, Error):
+            for race in races:
+                if race.id == race_id and race.status is RaceStatus.COMPLETED:
+                    return True
+        return False
+
+    async def _snapshot(self, call: Callable[..., R], *args) -> Optional[R]:
+        """Run a snapshot store call off the event loop; failures are a miss."""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, call, *args)
+        except Exception as e:
+            self.logger.warning(f"Race snapshot store unavailable: {e}")
+            return None
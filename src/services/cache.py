@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from core.error import Error
+from http_client import CacheValidators, ConditionalResponse
+
+T = TypeVar("T")
+
+
+class ConditionalCache(Generic[T]):
+    """
+    Single-resource cache that revalidates with ETag/Last-Modified once stale.
+    The stale value is served while it is being revalidated or if that fails.
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = asyncio.Lock()
+        self.value: Optional[T] = None
+        self.validators: Optional[CacheValidators] = None
+        self.fetched_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale = 0
+
+    async def get(
+        self,
+        fetch: Callable[
+            [Optional[CacheValidators]],
+            Awaitable[Union[Error, ConditionalResponse[T]]],
+        ],
+    ) -> Union[Error, T]:
+        if self.value is not None and self.lock.locked():
+            # Being revalidated: the value in hand is served meanwhile.
+            self.stale += 1
+            return self.value
+        # The lock is held while fetching so that concurrent callers of an
+        # expired entry wait for a single upstream request.
+        async with self.lock:
+            now = self.clock()
+            if self.value is not None and now - self.fetched_at < self.ttl:
+                self.hits += 1
+                return self.value
+
+            response = await fetch(self.validators if self.value is not None else None)
+            if isinstance(response, Error):
+                if self.value is not None:
+                    self.stale += 1
+                    return self.value
+                return response
+            if response.not_modified:
+                if self.value is None:
+                    # Invalidated while revalidating: no stale value to serve.
+                    return Error("Not modified, but nothing is cached")
+                self.revalidations += 1
+                self.fetched_at = now
+                return self.value
+            if response.value is None:
+                return Error("Empty response")
+            self.misses += 1
+            self.value = response.value
+            self.validators = response.validators
+            self.fetched_at = now
+            return response.value
+
+    def expire(self) -> None:
+        """Force the next get to revalidate the cached value upstream."""
+        self.fetched_at = float("-inf")
+
+    def invalidate(self) -> None:
+        self.value = None
+        self.validators = None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "stale": self.stale,
+        }
+
+
+class LRUCache(Generic[T]):
+    """Entry-count bounded LRU cache; entries stored with ttl=None never expire."""
+
+    def __init__(self, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[Hashable, Tuple[T, Optional[float]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: T, ttl: Optional[float]) -> None:
+        expires_at = None if ttl is None else self.clock() + ttl
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+        }
@@ -0,0 +1,48 @@
+from logging import Logger
+from typing import Dict, Union
+
+from core.driver import Driver
+from core.error import Error
+from services.f1_fantasy_service import F1FantasyService
+
+
+class CatalogDiff:
+    def __init__(self, added: int, removed: int, changed: int):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __str__(self) -> str:
+        return f"added={self.added} removed={self.removed} changed={self.changed}"
+
+
+def diff_drivers(old: Dict[int, Driver], new: Dict[int, Driver]) -> CatalogDiff:
+    common = old.keys() & new.keys()
+    return CatalogDiff(
+        added=len(new.keys() - old.keys()),
+        removed=len(old.keys() - new.keys()),
+        changed=sum(1 for player_id in common if old[player_id] != new[player_id]),
+    )
+
+
+class DriversCatalog:
+    """
+    Drivers and constructors of the fantasy game, keyed by player id. Readers
+    take self.drivers once per request: refresh replaces the whole mapping, so a
+    request never sees a half-updated catalog.
+    """
+
+    def __init__(self, f1_fantasy_service: F1FantasyService, logger: Logger):
+        self.f1_fantasy_service = f1_fantasy_service
+        self.logger = logger
+        self.drivers: Dict[int, Driver] = {}
+
+    def refresh(self) -> Union[Error, CatalogDiff]:
+        drivers = self.f1_fantasy_service.get_drivers()
+        if isinstance(drivers, Error):
+            self.logger.error(f"Drivers catalog refresh failed: {drivers.message}")
+            return drivers
+        diff = diff_drivers(self.drivers, drivers)
+        self.drivers = drivers
+        self.logger.info(f"Drivers catalog refreshed: {diff}")
+        return diff
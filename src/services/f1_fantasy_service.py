@@ -1,88 +1,195 @@
 import datetime
-from logging import Logger
-from typing import List, Union
+from typing import (
+    AsyncIterator,
+    Coroutine,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
 
-from adapters.leaderboard_adapters import to_league_standings
-from adapters.picked_player_adapters import to_picked_players
-from adapters.season_adapters import to_races
+from core.driver import Driver
 from core.error import Error
+from core.leaderboard_entrants import LeaderboardEntrant
 from core.league_standing import LeagueStanding
 from core.picked_player import PickedPlayer
-from core.race import Race, RaceStatus
-from http_client import HTTPClient, HTTPMethod
+from core.race import Race
+from event_loop import EventLoopThread
+from http_client import within_deadline
+from services.async_f1_fantasy_service import AsyncF1FantasyService
 
-LEAGUE_ID = "14886408"
+T = TypeVar("T")
+
+# Seconds each method has to get its answer, retries included: short for the
+# ones behind a command, longer for the ones refreshing in the background.
+# Iterators have it for every page.
+DEADLINES = {
+    "get_season_races": 15,
+    "refresh_season_races": 15,
+    "get_last_completed_race": 8,
+    "get_league_standing": 8,
+    "iter_league_standing": 15,
+    "is_session_valid": 15,
+    "get_last_race_standing": 8,
+    "iter_last_race_standing": 15,
+    "get_last_race_team_standing": 8,
+    "get_drivers": 15,
+    "get_last_race_team_standings": 15,
+}
 
 
 class F1FantasyService:
+    """
+    Blocking facade over AsyncF1FantasyService for the threaded dispatcher.
+    Every call is run on the shared event loop, so sync and async callers use
+    the same connection pool and caches, within the deadline of the method.
+    """
+
     def __init__(
-        self, http_client: HTTPClient, logger: Logger, cookies: str, league_id: str
+        self,
+        async_service: AsyncF1FantasyService,
+        event_loop: EventLoopThread,
+        deadlines: Optional[Dict[str, float]] = None,
     ):
-        self.http_client = http_client
-        self.logger = logger
-        self.cookies = cookies
-        self.league_id = league_id
+        self.async_service = async_service
+        self.event_loop = event_loop
+        self.deadlines = {**DEADLINES, **(deadlines or {})}
+
+    @property
+    def cookies(self) -> str:
+        return self.async_service.cookies
+
+    @cookies.setter
+    def cookies(self, cookies: str) -> None:
+        self.async_service.cookies = cookies
+
+    @property
+    def league_id(self) -> str:
+        return self.async_service.league_id
 
     """Get the races for the season."""
 
     def get_season_races(self) -> Union[Error, List[Race]]:
-        self.logger.debug("Getting all season")
-        return self.http_client.make_request(
-            method=HTTPMethod.GET,
-            path="/feeds/schedule/raceday_en.json",
-            headers={"Cookie": self.cookies},
-            decoder=to_races,
+        return self._run("get_season_races", self.async_service.get_season_races())
+
+    """Get the races for the season, revalidating the cached schedule."""
+
+    def refresh_season_races(self) -> Union[Error, List[Race]]:
+        return self._run(
+            "refresh_season_races", self.async_service.refresh_season_races()
         )
 
     """Get the last completed race"""
 
     def get_last_completed_race(self, now: datetime.datetime) -> Union[Error, Race]:
-        races = self.get_season_races()
-        if not isinstance(races, Error):
-            last_race = list(
-                filter(
-                    lambda race: race.start_timestamp < now
-                    and race.status is RaceStatus.COMPLETED,
-                    races,
-                )
-            )
-            if last_race:
-                return last_race.pop()
-            else:
-                return Error("There are no completed races")
-        return races
-
-    """Get the league standing"""
-
-    def get_league_standing(self) -> Union[Error, LeagueStanding]:
-        self.logger.debug("Get league standing")
-        return self.http_client.make_request(
-            method=HTTPMethod.GET,
-            path=f"/services/user/leaderboard/{self.league_id}/pvtleagueuserrankget/1/2102210/0/1/1/10/",  # noqa: E501
-            headers={"Cookie": self.cookies},
-            decoder=to_league_standings,
+        return self._run(
+            "get_last_completed_race",
+            self.async_service.get_last_completed_race(now=now),
+        )
+
+    """Get the top of the league standing"""
+
+    def get_league_standing(self, limit: int = 10) -> Union[Error, LeagueStanding]:
+        return self._run(
+            "get_league_standing", self.async_service.get_league_standing(limit=limit)
+        )
+
+    """Iterate over the whole league standing, page by page"""
+
+    def iter_league_standing(
+        self, page_size: Optional[int] = None, limit: Optional[int] = None
+    ) -> Iterator[Union[Error, LeaderboardEntrant]]:
+        return self._iterate(
+            self.async_service.iter_league_standing(page_size=page_size, limit=limit),
+            batch_size=page_size or self.async_service.leaderboard_page_size,
+            method="iter_league_standing",
+        )
+
+    """Check that a session cookie is accepted upstream"""
+
+    def is_session_valid(self, cookies: str) -> bool:
+        return self._run(
+            "is_session_valid", self.async_service.is_session_valid(cookies)
         )
 
-    """Get the last race standing"""
+    """Get the top of the last race standing"""
 
-    def get_last_race_standing(self, race_id: int) -> Union[Error, LeagueStanding]:
-        self.logger.debug("Getting last race standing")
-        return self.http_client.make_request(
-            method=HTTPMethod.GET,
-            path=f"/services/user/leaderboard/{self.league_id}/pvtleagueuserrankget/{race_id}/{LEAGUE_ID}/1/1/1/10/",  # noqa: E501
-            headers={"Cookie": self.cookies},
-            decoder=to_league_standings,
+    def get_last_race_standing(
+        self, race_id: int, limit: int = 10
+    ) -> Union[Error, LeagueStanding]:
+        return self._run(
+            "get_last_race_standing",
+            self.async_service.get_last_race_standing(race_id=race_id, limit=limit),
+        )
+
+    """Iterate over the whole last race standing, page by page"""
+
+    def iter_last_race_standing(
+        self,
+        race_id: int,
+        page_size: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[Union[Error, LeaderboardEntrant]]:
+        return self._iterate(
+            self.async_service.iter_last_race_standing(
+                race_id=race_id, page_size=page_size, limit=limit
+            ),
+            batch_size=page_size or self.async_service.leaderboard_page_size,
+            method="iter_last_race_standing",
         )
 
     """Get the last race standing "of a single team"""
 
     def get_last_race_team_standing(
-        self, race_id: int, user_id: str, f1_drivers: dict
+        self, race_id: int, user_id: str, f1_drivers: Dict[int, Driver]
     ) -> Union[Error, List[PickedPlayer]]:
-        self.logger.debug("Getting last race team standing")
-        return self.http_client.make_request(
-            method=HTTPMethod.GET,
-            path=f"/services/user/opponentteam/opponentgamedayplayerteamget/{race_id}/{user_id}/1/1/1",  # noqa: E501 TO BE CHECKED AFTER SECOND RACE
-            headers={"Cookie": self.cookies},
-            decoder=to_picked_players(f1_drivers),
+        return self._run(
+            "get_last_race_team_standing",
+            self.async_service.get_last_race_team_standing(
+                race_id=race_id, user_id=user_id, f1_drivers=f1_drivers
+            ),
+        )
+
+    """Get the drivers and constructors of the game"""
+
+    def get_drivers(self) -> Union[Error, Dict[int, Driver]]:
+        return self._run("get_drivers", self.async_service.get_drivers())
+
+    """Get the last race standing of several teams at once"""
+
+    def get_last_race_team_standings(
+        self, race_id: int, user_ids: List[str], f1_drivers: Dict[int, Driver]
+    ) -> Dict[str, Union[Error, List[PickedPlayer]]]:
+        return self._run(
+            "get_last_race_team_standings",
+            self.async_service.get_last_race_team_standings(
+                race_id=race_id, user_ids=user_ids, f1_drivers=f1_drivers
+            ),
         )
+
+    def _run(self, method: str, coroutine: Coroutine[None, None, T]) -> T:
+        return self.event_loop.run(within_deadline(self.deadlines[method], coroutine))
+
+    def _iterate(
+        self, items: AsyncIterator[T], batch_size: int, method: str
+    ) -> Iterator[T]:
+        # Items cross over from the event loop a page at a time, not one by one.
+        try:
+            while True:
+                batch = self._run(method, _next_batch(items, batch_size))
+                yield from batch
+                if len(batch) < batch_size:
+                    return
+        finally:
+            self.event_loop.run(items.aclose())  # type: ignore
+
+
+async def _next_batch(items: AsyncIterator[T], size: int) -> List[T]:
+    batch: List[T] = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            break
+    return batch
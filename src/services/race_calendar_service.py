@@ -0,0 +1,77 @@
+import datetime
+from logging import Logger
+from typing import Callable, List, Union
+
+from apscheduler.schedulers.base import BaseScheduler
+
+from core.error import Error
+from core.race_calendar import RaceCalendar
+from services.f1_fantasy_service import F1FantasyService
+
+REFRESH_JOB_ID = "race-calendar-refresh"
+
+
+class RaceCalendarService:
+    """
+    Keeps the RaceCalendar up to date. Instead of polling, the next refresh is
+    scheduled at the next expected race status transition.
+    """
+
+    def __init__(
+        self,
+        f1_fantasy_service: F1FantasyService,
+        scheduler: BaseScheduler,
+        logger: Logger,
+        completion_delay: datetime.timedelta = datetime.timedelta(hours=3),
+        retry_interval: datetime.timedelta = datetime.timedelta(minutes=30),
+    ):
+        self.f1_fantasy_service = f1_fantasy_service
+        self.scheduler = scheduler
+        self.logger = logger
+        self.completion_delay = completion_delay
+        self.retry_interval = retry_interval
+        self.calendar = RaceCalendar([])
+        self.listeners: List[Callable[[RaceCalendar], None]] = []
+
+    def add_listener(self, listener: Callable[[RaceCalendar], None]) -> None:
+        """Register a callback invoked whenever a race status changes."""
+        self.listeners.append(listener)
+
+    def refresh(self) -> Union[Error, RaceCalendar]:
+        now = datetime.datetime.now()
+        races = self.f1_fantasy_service.refresh_season_races()
+        if isinstance(races, Error):
+            self.logger.error(f"Race calendar refresh failed: {races.message}")
+            self._schedule_refresh(now + self.retry_interval)
+            return races
+
+        previous_calendar = self.calendar
+        # Swapping the reference is atomic, readers see either calendar.
+        self.calendar = RaceCalendar(races)
+        # Scheduled first, so that a failing listener can't stop the refreshes.
+        next_refresh = self.calendar.next_transition(
+            now=now,
+            completion_delay=self.completion_delay,
+            retry_interval=self.retry_interval,
+        )
+        if next_refresh is not None:
+            self._schedule_refresh(next_refresh)
+
+        if previous_calendar.statuses() != self.calendar.statuses():
+            self.logger.info("Race statuses changed")
+            for listener in self.listeners:
+                try:
+                    listener(self.calendar)
+                except Exception as e:
+                    self.logger.exception(f"Race calendar listener failed: {e}")
+        return self.calendar
+
+    def _schedule_refresh(self, run_date: datetime.datetime) -> None:
+        self.logger.debug(f"Next race calendar refresh at {run_date}")
+        self.scheduler.add_job(
+            func=self.refresh,
+            trigger="date",
+            run_date=run_date,
+            id=REFRESH_JOB_ID,
+            replace_existing=True,
+        )
@@ -0,0 +1,99 @@
+import datetime
+import threading
+from logging import Logger
+from typing import Callable, List, Optional
+
+from apscheduler.schedulers.base import BaseScheduler
+
+from core.session import Session
+
+RENEWAL_JOB_ID = "session-renewal"
+
+
+class SessionManager:
+    """
+    Owns the F1 Fantasy login session. The cookie is renewed in the background
+    before it expires and handed to the listeners, so the bot keeps serving
+    commands while a new session is obtained.
+    """
+
+    def __init__(
+        self,
+        login: Callable[[], Optional[Session]],
+        scheduler: BaseScheduler,
+        logger: Logger,
+        renewal_margin: datetime.timedelta = datetime.timedelta(hours=1),
+        default_lifetime: datetime.timedelta = datetime.timedelta(hours=24),
+        retry_interval: datetime.timedelta = datetime.timedelta(minutes=5),
+    ):
+        self.login = login
+        self.scheduler = scheduler
+        self.logger = logger
+        self.renewal_margin = renewal_margin
+        self.default_lifetime = default_lifetime
+        self.retry_interval = retry_interval
+        self.session: Optional[Session] = None
+        self.lock = threading.Lock()
+        self.listeners: List[Callable[[Session], None]] = []
+
+    def add_listener(self, listener: Callable[[Session], None]) -> None:
+        """Register a callback invoked with every new session."""
+        self.listeners.append(listener)
+
+    def renew(self, stale_cookie: Optional[str] = None) -> Optional[Session]:
+        """
+        Log in again and publish the new session. When stale_cookie is given the
+        renewal is skipped if the current session has already replaced it, so
+        concurrent callers rejected with the same cookie cause a single login.
+        """
+        with self.lock:
+            if (
+                stale_cookie is not None
+                and self.session is not None
+                and self.session.cookie != stale_cookie
+            ):
+                return self.session
+
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            self.logger.info("Renewing login session")
+            try:
+                session = self.login()
+            except Exception as e:
+                self.logger.error(e)
+                session = None
+            if session is None or not session.cookie:
+                self.logger.error("Login session renewal failed")
+                self._schedule_renewal(now + self.retry_interval)
+                return self.session
+
+            self._publish(session, now)
+            return session
+
+    def adopt(self, session: Session) -> None:
+        """Use a session obtained elsewhere, e.g. restored from the database."""
+        with self.lock:
+            self._publish(session, datetime.datetime.now(tz=datetime.timezone.utc))
+
+    def _publish(self, session: Session, now: datetime.datetime) -> None:
+        self.session = session
+        # Scheduled first, so that a failing listener can't stop the renewals.
+        expires_at = session.expires_at or now + self.default_lifetime
+        self._schedule_renewal(
+            max(expires_at - self.renewal_margin, now + self.retry_interval)
+        )
+
+        for listener in self.listeners:
+            try:
+                listener(session)
+            except Exception as e:
+                self.logger.exception(f"Login session listener failed: {e}")
+
+    def _schedule_renewal(self, run_date: datetime.datetime) -> None:
+        self.logger.debug(f"Next login session renewal at {run_date}")
+        self.scheduler.add_job(
+            func=self.renew,
+            trigger="date",
+            run_date=run_date,
+            id=RENEWAL_JOB_ID,
+            replace_existing=True,
+        )
@@ -0,0 +1,38 @@
+import asyncio
+import functools
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is in flight,
+    other callers with the same key wait for it and share its result.
+    """
+
+    def __init__(self) -> None:
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.merged = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        in_flight = self.in_flight.get(key)
+        if in_flight is None:
+            in_flight = asyncio.ensure_future(call())
+            self.in_flight[key] = in_flight
+            in_flight.add_done_callback(functools.partial(self._landed, key))
+            self.executed += 1
+        else:
+            self.merged += 1
+        # A cancelled caller, the first one too, must not cancel the shared call.
+        return await asyncio.shield(in_flight)
+
+    def _landed(self, key: Hashable, call: asyncio.Future) -> None:
+        del self.in_flight[key]
+        if not call.cancelled():
+            # Mark the exception as retrieved when every caller was cancelled.
+            call.exception()
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "merged": self.merged}
@@ -0,0 +1,73 @@
+from logging import Logger
+from typing import List, Optional, Union
+
+from adapters.persistence.race_snapshot_store import RaceSnapshotStore
+from core.error import Error
+from core.leaderboard_entrants import LeaderboardEntrant
+from core.race import Race
+from core.race_calendar import RaceCalendar
+from core.standings_history import StandingsHistory
+from services.f1_fantasy_service import F1FantasyService
+
+
+class StandingsHistoryService:
+    """
+    Keeps the StandingsHistory of the completed races. Readers take
+    self.history once per request: refresh replaces it whole.
+    """
+
+    def __init__(
+        self,
+        f1_fantasy_service: F1FantasyService,
+        logger: Logger,
+        snapshot_store: Optional[RaceSnapshotStore] = None,
+    ):
+        self.f1_fantasy_service = f1_fantasy_service
+        self.logger = logger
+        self.snapshot_store = snapshot_store
+        self.history = StandingsHistory.empty()
+
+    def refresh(self, calendar: RaceCalendar) -> Union[Error, StandingsHistory]:
+        """Add the completed races missing from the history, oldest first."""
+        history = self.history
+        for race in calendar.completed_races:
+            if history.has_race(race.id):
+                continue
+            entrants = self._get_race_standing(race)
+            if isinstance(entrants, Error):
+                self.logger.error(
+                    f"Standings history refresh failed at {race.name}: "
+                    f"{entrants.message}"
+                )
+                self.history = history
+                return entrants
+            history = history.with_race(race, entrants)
+            self.logger.info(f"Standings history: added {race.name}")
+        self.history = history
+        self.logger.info(f"Standings history refreshed: {history.stats()}")
+        return history
+
+    def _get_race_standing(self, race: Race) -> Union[Error, List[LeaderboardEntrant]]:
+        league_id = self.f1_fantasy_service.league_id
+        if self.snapshot_store is not None:
+            try:
+                snapshot = self.snapshot_store.load_standing(league_id, race.id)
+            except Exception as e:
+                self.logger.warning(f"Race snapshot store unavailable: {e}")
+                snapshot = None
+            if snapshot is not None:
+                return snapshot.entrants
+
+        entrants = []
+        for entrant in self.f1_fantasy_service.iter_last_race_standing(race_id=race.id):
+            if isinstance(entrant, Error):
+                return entrant
+            entrants.append(entrant)
+        if self.snapshot_store is not None:
+            try:
+                self.snapshot_store.save_standing(
+                    league_id, race.id, entrants, complete=True
+                )
+            except Exception as e:
+                self.logger.warning(f"Race snapshot store unavailable: {e}")
+        return entrants
@@ -1,9 +1,11 @@
+import datetime
 import logging
-from typing import List
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
 from urllib.request import Request
 
 from core.credentials import Credentials
-from psutil import Process
+from core.session import Session
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -41,6 +43,9 @@ class ChromeDriver:
     def close(self) -> None:
         self.driver.close()
 
+    def quit(self) -> None:
+        self.driver.quit()
+
     def login(self, url: str, credentials: Credentials) -> None:
         self.go_to_page(url=url)
         self.click_button_by_id(by_type=By.ID, button_id="truste-consent-button")
@@ -58,27 +63,40 @@ class ChromeDriver:
     def wait_for_request(self, path: str, timeout: int):
         return self.driver.wait_for_request(pat=path, timeout=timeout)
 
-    def get_player_cookie(self) -> str:
-        player_cookie = ""
+    def get_player_session(self) -> Optional[Session]:
         logger.debug("Get session cookie")
         try:
             request = self.driver.wait_for_request("/services/session/login", 120)
-            request_cookies = request.headers.get("Cookie").split(";")
-            login_session_cookie = [
-                match for match in request_cookies if "login-session" in match
-            ]
-
-            # F1_FANTASY_007 COOKIE
-            f1_fantasy_007_cookie = request.response.headers.get("Set-Cookie").split(
-                ";"
-            )[0]
-            player_cookie = f1_fantasy_007_cookie + ";" + login_session_cookie[0]
         except TimeoutException as e:
             logger.error(e)
-            logger.error("Session timeout - Proceeding to reboot")
-            self.reboot()
-        return player_cookie
+            logger.error("Session timeout")
+            return None
+        request_cookies = request.headers.get("Cookie").split(";")
+        login_session_cookie = [
+            match for match in request_cookies if "login-session" in match
+        ]
+
+        # F1_FANTASY_007 COOKIE
+        set_cookie = request.response.headers.get("Set-Cookie").split(";")
+        f1_fantasy_007_cookie = set_cookie[0]
+        return Session(
+            cookie=f1_fantasy_007_cookie + ";" + login_session_cookie[0],
+            expires_at=get_cookie_expiry(set_cookie[1:]),
+        )
 
-    def reboot(self):
-        logger.info("Shutdown for login session")
-        Process().terminate()
+
+def get_cookie_expiry(attributes: List[str]) -> Optional[datetime.datetime]:
+    """Expiry of a Set-Cookie header from its Max-Age or Expires attribute."""
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    expires_at = None
+    for attribute in attributes:
+        name, _, value = attribute.strip().partition("=")
+        try:
+            if name.lower() == "max-age":
+                # Max-Age has precedence over Expires
+                return now + datetime.timedelta(seconds=int(value))
+            elif name.lower() == "expires":
+                expires_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid cookie attribute {attribute}")
+    return expires_at